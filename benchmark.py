@@ -0,0 +1,226 @@
+"""Benchmark archive loading and every Dash callback on synthetic archives.
+
+    python benchmark.py --sizes 10000 100000 1000000 --output results.json
+
+Each archive size is written with inspector.synthetic into a scratch directory,
+loaded, and every callback is called directly (without a browser or server)
+for both metrics; the figure callbacks compute both metrics in one call. The
+wall time (minimum and median over the repeats), the peak memory allocated
+(traced separately, from one extra call) of every step and the JSON size of
+every callback response, plain and gzipped, are written as JSON with the
+memory held by every archive column, so results can be compared across
+commits. The string columns are also sized and filtered both as object
+strings and as Categoricals, side by side. Pass --lean to benchmark the float32 archive of the lean_archive option.
+"""
+import argparse
+import contextlib
+import functools
+import gzip
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import plotly
+
+from inspector.config import config
+from inspector import archive, synthetic
+from inspector.fetch_metadata import generate_dataframe_from_csv
+from inspector.utils import dec_year, metric_names as metrics
+from inspector import overview_callbacks, mode_callbacks, aperture_callbacks, wavelen_callbacks
+
+detectors = ["STIS/CCD", "STIS/NUV-MAMA", "STIS/FUV-MAMA"]
+
+
+def measure(function, repeats):
+    """Return the timings and traced peak memory of calling function()"""
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {'min_seconds': min(times),
+            'median_seconds': statistics.median(times),
+            'repeats': repeats,
+            'peak_memory_bytes': peak}
+
+
+def payload_sizes(response):
+    """Return the JSON length of a callback response, plain and gzip-compressed"""
+    payload = plotly.io.json.to_json_plotly(response).encode()
+    return {'response_bytes': len(payload), 'response_gzip_bytes': len(gzip.compress(payload))}
+
+
+def uncached(callback):
+    """Return a callback without its figure cache, so every call is computed"""
+    return getattr(callback, '__wrapped__', callback)
+
+
+def tallest_bar(figure):
+    """Return the x value of the tallest bar of a figure, as a click on it would"""
+    figure = json.loads(json.dumps(figure, cls=plotly.utils.PlotlyJSONEncoder))
+    best_x, best_y = None, -1
+    for trace in figure['data'] or []:
+        for x, y in zip(trace.get('x') or [], trace.get('y') or []):
+            if y is not None and y > best_y:
+                best_x, best_y = x, y
+    return {'points': [{'x': best_x}]}
+
+
+def callback_benchmarks(year_range):
+    """Return the name, metric and a call of every callback, with realistic selections.
+
+    The figure callbacks compute the figures of both metrics in one call; the
+    timelines are called once per metric.
+    """
+    spectroscopic, all_obstypes = ['Spectroscopic'], ['Imaging', 'Spectroscopic', 'Coronagraphic']
+    calls = {
+        ('update_detector_pie_figure', None): lambda: uncached(overview_callbacks.update_detector_pie_figure)(
+            year_range),
+        ('update_mode_figure', None): lambda: uncached(mode_callbacks.update_mode_figure)(
+            year_range, spectroscopic, detectors),
+        ('update_aperture_figure', None): lambda: uncached(aperture_callbacks.update_aperture_figure)(
+            year_range, all_obstypes, detectors),
+        ('update_wavelength_figure', None): lambda: uncached(wavelen_callbacks.update_wavelength_figure)(
+            year_range, spectroscopic, detectors[1:]),
+    }
+
+    mode_figures = calls[('update_mode_figure', None)]()
+    aperture_figures = calls[('update_aperture_figure', None)]()
+    wavelength_figures = calls[('update_wavelength_figure', None)]()
+    for metric in metrics:
+        mode_click = tallest_bar(mode_figures[metric])
+        aperture_click = tallest_bar(aperture_figures[metric])
+        wavelength_click = tallest_bar(wavelength_figures[metric])
+        calls.update({
+            ('update_mode_timeline', metric): functools.partial(
+                mode_callbacks.update_mode_timeline, year_range, metric, mode_click),
+            ('update_aperture_timeline', metric): functools.partial(
+                aperture_callbacks.update_aperture_timeline, year_range, metric, aperture_click, all_obstypes),
+            ('update_wav_bin_timeline_figure', metric): functools.partial(
+                wavelen_callbacks.update_wav_bin_timeline_figure, year_range, metric, wavelength_click,
+                spectroscopic, detectors[1:]),
+        })
+    return calls
+
+
+def string_column_selections(mast):
+    """Return the object-string and categorical copies of the string columns and a selection on each"""
+    categorical = mast[archive.categorical_columns]
+    selection = {'Instrument Config': detectors[1:], 'obstype': ['Spectroscopic'],
+                 'Filters/Gratings': list(categorical['Filters/Gratings'].cat.categories[::2]),
+                 'Apertures': list(categorical['Apertures'].cat.categories[::2])}
+
+    def select(columns, mask):
+        selected = np.ones(len(columns), dtype=bool)
+        for name, values in selection.items():
+            selected &= mask(columns[name], values)
+        return selected
+
+    return {'object': (categorical.astype(object),
+                       lambda columns: select(columns, lambda column, values: column.isin(values).values)),
+            'categorical': (categorical, lambda columns: select(columns, archive.category_mask))}
+
+
+def benchmark_size(n_rows, seed, repeats, workdir):
+    """Run every benchmark on one synthetic archive, returning the result records"""
+    csv_path = os.path.join(workdir, config['inspector']['csv_name'])
+    synthetic.write_synthetic_csv(csv_path, n_rows, seed)
+    results = []
+
+    def record(name, function, metric=None, repeats=repeats, payload=False, **extra):
+        result = {'benchmark': name, 'rows': n_rows, 'metric': metric}
+        result.update(extra)
+        result.update(measure(function, repeats))
+        if payload:
+            result.update(payload_sizes(function()))
+        results.append(result)
+        print(f"{n_rows:>10} {name:<32} {metric or '':<8} {1000*result['min_seconds']:10.1f} ms "
+              f"{result['peak_memory_bytes']/2**20:10.1f} MiB "
+              f"{result.get('response_bytes', 0)/1024:8.1f} KiB", file=sys.stderr)
+
+    record('generate_dataframe_from_csv', lambda: generate_dataframe_from_csv(csv_path))
+    mast = archive.read_source(csv_path)
+    record('read_source', lambda: archive.read_source(csv_path))
+    record('decimal_years', lambda: dec_year(pd.to_datetime(mast['Start Time'], format="%Y-%m-%d %H:%M:%S")))
+    record('prepare_archive', lambda: archive.prepare_archive(mast))
+    # The string columns as plain Python strings and as Categoricals: their
+    # memory, and the time of a four-checklist selection on them
+    for representation, (columns, select) in string_column_selections(mast).items():
+        record('string_columns_' + representation, functools.partial(select, columns),
+               column_bytes=int(columns.memory_usage(index=False, deep=True).sum()))
+    del mast
+    # Parsing the csv and writing the cache, then starting from the cache
+    record('load_archive_rebuild', lambda: archive.load_archive(csv_path, rebuild_cache=True), repeats=1)
+    record('load_archive_cached', lambda: archive.load_archive(csv_path))
+    memory = archive.memory_report()
+    results.append(dict(memory, benchmark='archive_memory', rows=n_rows, metric=None))
+    print(archive.format_memory_report(memory), file=sys.stderr)
+
+    years = archive.get_dataset()['years']
+    year_range = [int(years[0]), int(years[-1]) + 1]
+    for (name, metric), function in callback_benchmarks(year_range).items():
+        record(name, function, metric, payload=True)
+
+    return results
+
+
+def git_commit():
+    """Return the current git commit of the repository, if there is one"""
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark archive loading and the Dash callbacks')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000],
+                        help='numbers of observations in the synthetic archives')
+    parser.add_argument('--repeats', type=int, default=5, help='timed calls of every benchmark')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic archives')
+    parser.add_argument('--output', help='write the JSON results to this file instead of stdout')
+    parser.add_argument('--lean', action='store_true', help='store the archive as float32 (lean_archive)')
+    args = parser.parse_args()
+
+    config['inspector']['use_apache'] = False
+    config['inspector']['reload_interval'] = 0
+    config['inspector']['lean_archive'] = args.lean
+    results = []
+    # Keep stdout for the JSON report
+    with tempfile.TemporaryDirectory() as workdir, contextlib.redirect_stdout(sys.stderr):
+        config['inspector']['outdir'] = workdir + os.sep
+        for n_rows in args.sizes:
+            results += benchmark_size(n_rows, args.seed, args.repeats, workdir)
+
+    report = {'commit': git_commit(),
+              'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'platform': platform.platform(),
+              'python': platform.python_version(),
+              'numpy': np.__version__,
+              'pandas': pd.__version__,
+              'seed': args.seed,
+              'lean': args.lean,
+              'results': results}
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
@@ -1,26 +1,19 @@
-
-import dash_html_components as html
-import dash_core_components as dcc
 import json
 import numpy as np
-from datetime import datetime
+from dash import dcc, html
 
 from .config import config
-from .fetch_metadata import generate_dataframe_from_csv, generate_csv_from_mast
+from .archive import get_dataset, publish_hooks
 from .server import app
-from .utils import dt_to_dec
+from .metrics import instrument_callbacks, register_metrics_route
+from .profiling import profile_callbacks
+from .payload import compress_responses
 from . import overview_callbacks, mode_callbacks, aperture_callbacks, wavelen_callbacks
 
 
 # Read in Config file
-outdir = config['inspector']['outdir']
-csv_name = config['inspector']['csv_name']
-use_apache = config['inspector']['use_apache']
-gen_csv = config['inspector']['gen_csv']
-datatype = config['inspector']['datatype']
 instrument = config['inspector']['instrument']
 stylesheets = config['inspector']['stylesheets']
-mast = config['inspector']['mast']
 
 # Overview Parameters -- affected by callbacks
 overview_detectors = ["STIS/CCD", "STIS/NUV-MAMA", "STIS/FUV-MAMA"]
@@ -46,86 +39,77 @@ aperture_detectors = ["STIS/CCD",
                            "STIS/NUV-MAMA", "STIS/FUV-MAMA"]
 aperture_metric = "n-obs"
 
-if use_apache:
-    mast = generate_dataframe_from_csv("https://www.stsci.edu/~STIS/stis_archive.csv")
-else:
-    mast = generate_dataframe_from_csv(outdir+csv_name)
-
-# Overview Page Plots --------------------------------------------
-overview_df = mast[["Start Time", "obstype","Instrument Config","Exp Time"]].copy()
-start_times = np.array([datetime.strptime(str(start_time), "%Y-%m-%d %H:%M:%S")
-                        for start_time in overview_df['Start Time']])
-
-overview_df.loc[:,'Decimal Year'] = [dt_to_dec(time) for time in start_times]
-overview_df = overview_df[["Decimal Year",
-                     "obstype", "Instrument Config", "Exp Time"]]
-
-# Wavelength Page Plots --------------------------------------------
-wav_df = mast[["Central Wavelength","Start Time", "obstype", "Instrument Config", "Exp Time"]].copy()
-start_times = np.array([datetime.strptime(str(start_time), "%Y-%m-%d %H:%M:%S")
-                        for start_time in wav_df['Start Time']])
-
-wav_df.loc[:,'Decimal Year'] = [dt_to_dec(time) for time in start_times]
-wav_df = wav_df[["Central Wavelength", "Decimal Year",
-                           "obstype", "Instrument Config", "Exp Time"]]
-
-# Modes Page Plots --------------------------------------------------
-spec_mode_groups = config['modes']['spec_groups']
-spec_mode_labels = config['modes']['spec_labels']
-
-im_mode_groups = config['modes']['im_groups']
-im_mode_labels = config['modes']['im_labels']
-
-mode_groups = []
-mode_labels = []
-if "Imaging" in selected_modes:
-    mode_groups += im_mode_groups
-    mode_labels += im_mode_labels
-if "Spectroscopic" in selected_modes:
-    mode_groups += spec_mode_groups
-    mode_labels += spec_mode_labels
-
-modes_df = mast[["Filters/Gratings", "Start Time",
-                      "obstype", "Instrument Config", "Exp Time"]].copy()
-start_times = np.array([datetime.strptime(str(start_time), "%Y-%m-%d %H:%M:%S")
-                        for start_time in modes_df['Start Time']])
-
-# Convert to Start Times to Decimal Years
-modes_df.loc[:,'Decimal Year'] = [dt_to_dec(time) for time in start_times]
-modes_df = modes_df[["Filters/Gratings", "Decimal Year",
-                     "obstype", "Instrument Config", "Exp Time"]]
-
-# Apertures Page Plots ------------------------------------------------
-aperture_groups = config['apertures']['groups']
-aperture_labels = config['apertures']['labels']
-
-apertures_df = mast[["Apertures", "Start Time",
-                          "obstype", "Instrument Config", "Exp Time"]].copy()
-start_times = np.array([datetime.strptime(str(start_time), "%Y-%m-%d %H:%M:%S")
-                        for start_time in apertures_df['Start Time']])
-# Convert to Start Times to Decimal Years
-apertures_df.loc[:,'Decimal Year'] = [
-    dt_to_dec(time) for time in start_times]
-apertures_df = apertures_df[[
-    "Apertures", "Decimal Year", "obstype", "Instrument Config", "Exp Time"]]
+# Figures for the default selections, embedded in the layout so the page renders
+# without a round of initial callbacks
+_default_figures = None
+
+
+def year_bounds(dataset):
+    """Return the date slider bounds, shared by every tab"""
+    return int(dataset['years'][0]), int(dataset['years'][-1]) + 1
+
+
+def default_figures(dataset):
+    """Return the figures of the default selections, computed once per archive version"""
+    global _default_figures
+
+    figures = _default_figures
+    if figures is None or figures['version'] != dataset['version']:
+        year_range = list(year_bounds(dataset))
+        wavelength_figures = wavelen_callbacks.update_wavelength_figure(
+            year_range, wav_obstype, wav_detectors, dataset=dataset)
+        # The stores hold a figure per metric; the graphs are filled from them in the browser
+        figures = {
+            'version': dataset['version'],
+            'detector-pie-store': overview_callbacks.update_detector_pie_figure(year_range, dataset=dataset),
+            'wavelength-histogram-store': wavelength_figures,
+            'wavelength-bin-timeline': wavelen_callbacks.update_wav_bin_timeline_figure(
+                year_range, wav_metric, None, wav_obstype, wav_detectors, dataset=dataset),
+            'modes-plot-store': mode_callbacks.update_mode_figure(
+                year_range, selected_modes, mode_detectors, dataset=dataset),
+            'mode-timeline': mode_callbacks.update_mode_timeline(year_range, mode_metric, None, dataset=dataset),
+            'apertures-plot-store': aperture_callbacks.update_aperture_figure(
+                year_range, aperture_obstype, aperture_detectors, dataset=dataset),
+            'aperture-timeline': aperture_callbacks.update_aperture_timeline(
+                year_range, aperture_metric, None, aperture_obstype, dataset=dataset)}
+        _default_figures = figures
+    return figures
+
+
+# Precompute the default figures for every archive loaded from now on
+publish_hooks.append(default_figures)
 
 # App Layout
 
-# Header
-app.layout = html.Div(children=[
-    html.H1(f'{instrument} Archive Inspector'),
+def serve_layout():
+    """Build the page layout from the current archive.
+
+    Served as a function so every page load sees the statistics and slider
+    bounds of the most recently loaded archive.
+    """
+    dataset = get_dataset()
+    summary = dataset['summary']
+    figures = default_figures(dataset)
+
+    # Date slider bounds, shared by every tab
+    year_min, year_max = year_bounds(dataset)
+    year_marks = {str(year): str(year) for year in dataset['years']}
+
+    # Header
+    return html.Div(children=[
+        html.H1(f'{instrument} Archive Inspector'),
 
-    # Modes Tab
-    dcc.Tabs(id="tabs", children=[
+        # Modes Tab
+        dcc.Tabs(id="tabs", children=[
 
-        dcc.Tab(label='Overview', children=[
-            # Div Container for metric chooser (positioned far right)
+            dcc.Tab(label='Overview', children=[
+                # Div Container for metric chooser (positioned far right)
 
 
-            html.Div(children=[
-                html.H4(id="stis-intro",children="Introduction to STIS"),
+                html.Div(children=[
+                    html.H4(id="stis-intro",children="Introduction to STIS"),
 
-                html.P("""
+                    html.P("""
                 The Space Telescope Imaging Spectrograph (STIS), 
                 installed on the Hubble Space Telescope during Servicing Mission 2 (1997).
                 STIS provides spatially resolved spectroscopy from 1150 to 10,300 Å at low 
@@ -140,206 +124,217 @@ app.layout = html.Div(children=[
                 that began in August 2004, when a power supply in the Side-2 electronics had failed.
                 """),
 
-                html.H4(id="stis-stats", children="STIS Archive Statistics"),
+                    html.H4(id="stis-stats", children="STIS Archive Statistics"),
+
+                    html.P(f"""Total STIS Observations: {summary['n_obs']}"""),
+                    html.P(f"""Total STIS Exposure Time: {np.round(summary['exptime']/60/60,2)} Hours"""),
+                    html.P(f"""Earliest Observation in Archive: {summary['earliest']}"""),
+                    html.P(f"""Most Recent Observation in Archive: {summary['latest']}""")
+                    ],
+                    style={'width': '40%', 'display': 'inline-block', 
+                           'padding': 20, 'vertical-align': 'top'}),
+
+                html.Div(children=[dcc.Dropdown(id="detector-metric-dropdown",
+                                                options=[{'label': "Total Number of Observations", 'value': 'n-obs'},
+                                                         {'label': "Total Exposure Time (Hours)", 'value': 'exptime'}],
+                                                value=overview_metric, clearable=False),
+                    dcc.Store(id='detector-pie-store', data=figures['detector-pie-store']),
+                    dcc.Graph(id='detector-pie-chart'),
+                                  ],
+                         style={'width': '40%', 'display': 'inline-block', 'padding': 20}),
+
+                html.Div(children=[
+                    dcc.RangeSlider(id='detector-date-slider',
+                                    min=year_min,
+                                    max=year_max,
+                                    value=[year_min, year_max],
+                                    marks=year_marks,
+                                    included=True)
+                ])]),
+
+            dcc.Tab(label="Wavelength", children=[
+                # Div Container for detector checklist (positioned far left)
+                html.Div(children=[
+                    dcc.Checklist(id="wavelength-detector-checklist",
+                                  options=[{'label': "CCD", 'value': 'STIS/CCD'},
+                                           {'label': "NUV-MAMA",
+                                               'value': 'STIS/NUV-MAMA'},
+                                           {'label': "FUV-MAMA", 'value': 'STIS/FUV-MAMA'}],
+                                  value=wav_detectors)
+                ], style={'width': '25%', 'display': 'inline-block'}),
+
+                # Div Container for obstype checklist (positioned middle)
+                html.Div(children=[
+                    dcc.Checklist(id="wavelength-type-checklist",
+                                  options=[{'label': "Imaging Observations", 'value': 'Imaging'},
+                                           {'label': "Spectroscopic Observations", 'value': 'Spectroscopic'}],
+                                  value=wav_obstype)
+                ], style={'width': '25%', 'display': 'inline-block','vertical-align':'top'}),
+
+                # Div Container for metric chooser (positioned far right)
+                html.Div(children=[
+                    dcc.Dropdown(id="wavelength-metric-dropdown",
+                                 options=[{'label': "Total Number of Observations", 'value': 'n-obs'},
+                                          {'label': "Total Exposure Time (Hours)", 'value': 'exptime'}],
+                                 value=wav_metric, clearable=False)
+                ], style={'width': '40%', 'display': 'inline-block'}),
+
+                # Div Container for Graph and Range Slider
+                html.Div(children=[
+                    dcc.Store(id='wavelength-histogram-store', data=figures['wavelength-histogram-store']),
+                    dcc.Graph(id='wavelength-histogram'),
+                ],
+                    style={'width': '60%', 'display': 'inline-block', 'padding': 20}),
 
-                html.P(f"""Total STIS Observations: {len(mast)}"""),
-                html.P(f"""Total STIS Exposure Time: {np.round(np.sum(mast['Exp Time'])/60/60,2)} Hours"""),
-                html.P(f"""Earliest Observation in Archive: {min(mast['Start Time'])}"""),
-                html.P(f"""Most Recent Observation in Archive: {max(mast['Start Time'])}""")
+                # Div Container for Cenwave Timeline
+                html.Div(children=[
+                    dcc.Graph(id='wavelength-bin-timeline', figure=figures['wavelength-bin-timeline']),
                 ],
-                style={'width': '40%', 'display': 'inline-block', 
-                       'padding': 20, 'vertical-align': 'top'}),
-
-            html.Div(children=[dcc.Dropdown(id="detector-metric-dropdown",
-                                            options=[{'label': "Total Number of Observations", 'value': 'n-obs'},
-                                                     {'label': "Total Exposure Time (Hours)", 'value': 'exptime'}],
-                                            value=overview_metric, clearable=False),
-                dcc.Graph(id='detector-pie-chart'),
-                              ],
-                     style={'width': '40%', 'display': 'inline-block', 'padding': 20}),
-
-            html.Div(children=[
-                dcc.RangeSlider(id='detector-date-slider',
-                                min=int(min(overview_df['Decimal Year'])),
-                                max=int(max(overview_df['Decimal Year'])) + 1,
-                                value=[int(min(overview_df['Decimal Year'])),
-                                       int(max(overview_df['Decimal Year'])) + 1],
-                                marks={str(int(year)): str(int(year))
-                                       for year in overview_df['Decimal Year'].unique()},
-                                included=True)
-            ])]),
+                    style={'width': '35%', 'display': 'inline-block'}),
 
-        dcc.Tab(label="Wavelength", children=[
-            # Div Container for detector checklist (positioned far left)
-            html.Div(children=[
-                dcc.Checklist(id="wavelength-detector-checklist",
-                              options=[{'label': "CCD", 'value': 'STIS/CCD'},
-                                       {'label': "NUV-MAMA",
-                                           'value': 'STIS/NUV-MAMA'},
-                                       {'label': "FUV-MAMA", 'value': 'STIS/FUV-MAMA'}],
-                              value=wav_detectors)
-            ], style={'width': '25%', 'display': 'inline-block'}),
-
-            # Div Container for obstype checklist (positioned middle)
-            html.Div(children=[
-                dcc.Checklist(id="wavelength-type-checklist",
-                              options=[{'label': "Imaging Observations", 'value': 'Imaging'},
-                                       {'label': "Spectroscopic Observations", 'value': 'Spectroscopic'}],
-                              value=wav_obstype)
-            ], style={'width': '25%', 'display': 'inline-block','vertical-align':'top'}),
-
-            # Div Container for metric chooser (positioned far right)
-            html.Div(children=[
-                dcc.Dropdown(id="wavelength-metric-dropdown",
-                             options=[{'label': "Total Number of Observations", 'value': 'n-obs'},
-                                      {'label': "Total Exposure Time (Hours)", 'value': 'exptime'}],
-                             value=wav_metric, clearable=False)
-            ], style={'width': '40%', 'display': 'inline-block'}),
-
-            # Div Container for Graph and Range Slider
-            html.Div(children=[
-                dcc.Graph(id='wavelength-histogram'),
-            ],
-                style={'width': '60%', 'display': 'inline-block', 'padding': 20}),
-
-            # Div Container for Cenwave Timeline
-            html.Div(children=[
-                dcc.Graph(id='wavelength-bin-timeline'),
-            ],
-                style={'width': '35%', 'display': 'inline-block'}),
-
-            html.Div(children=[
-                dcc.RangeSlider(id='wavelength-date-slider',
-                                min=int(min(wav_df['Decimal Year'])),
-                                max=int(max(wav_df['Decimal Year'])) + 1,
-                                value=[int(min(wav_df['Decimal Year'])),
-                                       int(max(wav_df['Decimal Year'])) + 1],
-                                marks={str(int(year)): str(int(year))
-                                       for year in wav_df['Decimal Year'].unique()},
-                                included=True)
-            ], style={'padding': 20}),
+                html.Div(children=[
+                    dcc.RangeSlider(id='wavelength-date-slider',
+                                    min=year_min,
+                                    max=year_max,
+                                    value=[year_min, year_max],
+                                    marks=year_marks,
+                                    included=True)
+                ], style={'padding': 20}),
 
             
-        ]),    
-
-        dcc.Tab(label='Modes', children=[html.Div(children=[
-
-            # Div Container for detector checklist (positioned far left)
-            html.Div(children=[
-                dcc.Checklist(id="modes-detector-checklist",
-                              options=[{'label': "CCD", 'value': 'STIS/CCD'},
-                                       {'label': "NUV-MAMA",'value': 'STIS/NUV-MAMA'},
-                                       {'label': "FUV-MAMA",'value': 'STIS/FUV-MAMA'}],
-                                      value=mode_detectors)
-                              ], style={'width': '25%', 'display': 'inline-block'}),
-
-            # Div Container for obstype checklist (positioned middle)
-            html.Div(children=[
-                dcc.Checklist(id="modes-type-checklist",
-                              options=[{'label': "Imaging Modes", 'value': 'Imaging'},
-                                       {'label': "Spectroscopic Modes",'value': 'Spectroscopic'}], 
-                                       value=selected_modes)
-                              ], style={'width': '25%', 'display': 'inline-block','vertical-align':'top'}),
-
-            # Div Container for metric chooser (positioned far right)
-            html.Div(children=[
-                dcc.Dropdown(id="modes-metric-dropdown",
-                             options=[{'label': "Total Number of Observations", 'value': 'n-obs'},
-                                      {'label': "Total Exposure Time (Hours)",'value': 'exptime'}], 
-                                      value=mode_metric, clearable=False)
-                              ], style={'width': '40%', 'display': 'inline-block'}),
-
-            # Div Container for Graph and Range Slider
-            html.Div(children=[
-                dcc.Graph(id='modes-plot-with-slider'),
-                            ],
-                     style={'width': '60%', 'display': 'inline-block', 'padding': 20}),
-            # Div Container for Mode Timeline
-            html.Div(children=[
-                dcc.Graph(id='mode-timeline'),
-                #dcc.Graph(id='mode-pie-chart')
-                ],
-                          style={'width': '35%', 'display': 'inline-block'}),
-
-            # Div Container for Mode Pie Chart
-            #html.Div(children=[
-            #   dcc.Graph(id='mode-pie-chart')],
-            #              style={'width': '40%', 'display': 'inline-block'}),
-
-            html.Div(children=[
-                dcc.RangeSlider(id='modes-date-slider',
-                                min=int(min(modes_df['Decimal Year'])),
-                                max=int(max(modes_df['Decimal Year'])) + 1,
-                                value=[int(min(modes_df['Decimal Year'])),
-                                       int(max(modes_df['Decimal Year'])) + 1],
-                                marks={str(int(year)): str(int(year))
-                                       for year in modes_df['Decimal Year'].unique()},
-                                included=True)
-            ], style={'padding': 20}),
-                          ]),
+            ]),    
+
+            dcc.Tab(label='Modes', children=[html.Div(children=[
+
+                # Div Container for detector checklist (positioned far left)
+                html.Div(children=[
+                    dcc.Checklist(id="modes-detector-checklist",
+                                  options=[{'label': "CCD", 'value': 'STIS/CCD'},
+                                           {'label': "NUV-MAMA",'value': 'STIS/NUV-MAMA'},
+                                           {'label': "FUV-MAMA",'value': 'STIS/FUV-MAMA'}],
+                                          value=mode_detectors)
+                                  ], style={'width': '25%', 'display': 'inline-block'}),
+
+                # Div Container for obstype checklist (positioned middle)
+                html.Div(children=[
+                    dcc.Checklist(id="modes-type-checklist",
+                                  options=[{'label': "Imaging Modes", 'value': 'Imaging'},
+                                           {'label': "Spectroscopic Modes",'value': 'Spectroscopic'}], 
+                                           value=selected_modes)
+                                  ], style={'width': '25%', 'display': 'inline-block','vertical-align':'top'}),
+
+                # Div Container for metric chooser (positioned far right)
+                html.Div(children=[
+                    dcc.Dropdown(id="modes-metric-dropdown",
+                                 options=[{'label': "Total Number of Observations", 'value': 'n-obs'},
+                                          {'label': "Total Exposure Time (Hours)",'value': 'exptime'}], 
+                                          value=mode_metric, clearable=False)
+                                  ], style={'width': '40%', 'display': 'inline-block'}),
+
+                # Div Container for Graph and Range Slider
+                html.Div(children=[
+                    dcc.Store(id='modes-plot-store', data=figures['modes-plot-store']),
+                    dcc.Graph(id='modes-plot-with-slider'),
+                                ],
+                         style={'width': '60%', 'display': 'inline-block', 'padding': 20}),
+                # Div Container for Mode Timeline
+                html.Div(children=[
+                    dcc.Graph(id='mode-timeline', figure=figures['mode-timeline']),
+                    #dcc.Graph(id='mode-pie-chart')
+                    ],
+                              style={'width': '35%', 'display': 'inline-block'}),
+
+                # Div Container for Mode Pie Chart
+                #html.Div(children=[
+                #   dcc.Graph(id='mode-pie-chart')],
+                #              style={'width': '40%', 'display': 'inline-block'}),
+
+                html.Div(children=[
+                    dcc.RangeSlider(id='modes-date-slider',
+                                    min=year_min,
+                                    max=year_max,
+                                    value=[year_min, year_max],
+                                    marks=year_marks,
+                                    included=True)
+                ], style={'padding': 20}),
+                              ]),
             
                           
-                          ]),
+                              ]),
 
             
 
-        # Apertures Tab
-        dcc.Tab(label='Apertures', children=[html.Div(children=[
-
-            # Div Container for detector checklist (positioned far left)
-            html.Div(children=[
-                dcc.Checklist(id="apertures-detector-checklist",
-                              options=[{'label': "CCD", 'value': 'STIS/CCD'},
-                                       {'label': "NUV-MAMA",
-                                        'value': 'STIS/NUV-MAMA'},
-                                       {'label': "FUV-MAMA",
-                                        'value': 'STIS/FUV-MAMA'}
-                                       ],
-                              value=aperture_detectors)
-            ], style={'width': '25%', 'display': 'inline-block'}),
-
-            # Div Container for obstype checklist (positioned middle)
-            html.Div(children=[
-                dcc.Checklist(id="apertures-type-checklist",
-                              options=[{'label': "Imaging Observations", 'value': 'Imaging'},
-                                       {'label': "Spectroscopic Observations",
-                                        'value': 'Spectroscopic'},
-                                       {'label': "Coronagraphic Observations",
-                                        'value': 'Coronagraphic'}
-                                       ], value=aperture_obstype)
-            ], style={'width': '25%', 'display': 'inline-block'}),
-            # Div Container for metric chooser (positioned far right)
-            html.Div(children=[
-                dcc.Dropdown(id="apertures-metric-dropdown",
-                             options=[{'label': "Total Number of Observations", 'value': 'n-obs'},
-                                      {'label': "Total Exposure Time (Hours)",
-                                       'value': 'exptime'}
-                                      ], value=aperture_metric, clearable=False)
-            ], style={'width': '40%', 'display': 'inline-block'}),
-            # Div Container for Graph and Range Slider
-            html.Div(children=[
-                dcc.Graph(id='apertures-plot-with-slider'),
-                ],
-                style={'width': '60%', 'display': 'inline-block', 'padding': 20}),
+            # Apertures Tab
+            dcc.Tab(label='Apertures', children=[html.Div(children=[
+
+                # Div Container for detector checklist (positioned far left)
+                html.Div(children=[
+                    dcc.Checklist(id="apertures-detector-checklist",
+                                  options=[{'label': "CCD", 'value': 'STIS/CCD'},
+                                           {'label': "NUV-MAMA",
+                                            'value': 'STIS/NUV-MAMA'},
+                                           {'label': "FUV-MAMA",
+                                            'value': 'STIS/FUV-MAMA'}
+                                           ],
+                                  value=aperture_detectors)
+                ], style={'width': '25%', 'display': 'inline-block'}),
+
+                # Div Container for obstype checklist (positioned middle)
+                html.Div(children=[
+                    dcc.Checklist(id="apertures-type-checklist",
+                                  options=[{'label': "Imaging Observations", 'value': 'Imaging'},
+                                           {'label': "Spectroscopic Observations",
+                                            'value': 'Spectroscopic'},
+                                           {'label': "Coronagraphic Observations",
+                                            'value': 'Coronagraphic'}
+                                           ], value=aperture_obstype)
+                ], style={'width': '25%', 'display': 'inline-block'}),
+                # Div Container for metric chooser (positioned far right)
+                html.Div(children=[
+                    dcc.Dropdown(id="apertures-metric-dropdown",
+                                 options=[{'label': "Total Number of Observations", 'value': 'n-obs'},
+                                          {'label': "Total Exposure Time (Hours)",
+                                           'value': 'exptime'}
+                                          ], value=aperture_metric, clearable=False)
+                ], style={'width': '40%', 'display': 'inline-block'}),
+                # Div Container for Graph and Range Slider
+                html.Div(children=[
+                    dcc.Store(id='apertures-plot-store', data=figures['apertures-plot-store']),
+                    dcc.Graph(id='apertures-plot-with-slider'),
+                    ],
+                    style={'width': '60%', 'display': 'inline-block', 'padding': 20}),
+
+                # Div Container for Mode Timeline
+                html.Div(children=[
+                    dcc.Graph(id='aperture-timeline', figure=figures['aperture-timeline']),
+                    #dcc.Graph(id='aperture-pie-chart')
+                    ],
+                    style={'width': '35%', 'display': 'inline-block'}),
+
+                html.Div(children=[
+                    dcc.RangeSlider(id='apertures-date-slider',
+                                    min=year_min,
+                                    max=year_max,
+                                    value=[year_min, year_max],
+                                    marks=year_marks,
+                                    included=True)
+                ], style={'padding':20}),
+            ])]),
+            html.Div(id='tabs-content')
+        ])])
 
-            # Div Container for Mode Timeline
-            html.Div(children=[
-                dcc.Graph(id='aperture-timeline'),
-                #dcc.Graph(id='aperture-pie-chart')
-                ],
-                style={'width': '35%', 'display': 'inline-block'}),
-
-            html.Div(children=[
-                dcc.RangeSlider(id='apertures-date-slider',
-                                min=int(min(modes_df['Decimal Year'])),
-                                max=int(
-                                    max(modes_df['Decimal Year'])) + 1,
-                                value=[int(min(modes_df['Decimal Year'])),
-                                       int(max(modes_df['Decimal Year'])) + 1],
-                                marks={str(int(year)): str(int(year)) for year in
-                                       modes_df['Decimal Year'].unique()},
-                                included=True)
-            ], style={'padding':20}),
-        ])]),
-        html.Div(id='tabs-content')
-    ])])
+
+app.layout = serve_layout
+
+# Gzip large responses
+compress_responses(app.server)
+
+# Record latency, rows scanned and payload sizes of every callback, served at /metrics
+instrument_callbacks(app)
+register_metrics_route(app.server)
+
+# Opt-in cProfile dumps of callback calls (INSPECTOR_PROFILE=1 or the 'profile' config option)
+profile_callbacks(app)
+
+# ... and for the archive that is already loaded
+default_figures(get_dataset())
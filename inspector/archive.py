@@ -0,0 +1,378 @@
+import logging
+import os
+import sys
+import threading
+import time
+from urllib import parse
+
+import numpy as np
+import pandas as pd
+
+from . import cache
+from .config import config
+from .cube import build_cube
+from .download import download_archive
+from .fetch_metadata import generate_dataframe_from_csv, partitions_match, read_partitions
+from .utils import dec_year
+
+logger = logging.getLogger(__name__)
+
+# Columns of the prepared archive that the inspector tabs read
+archive_columns = ["Decimal Year", "obstype", "Instrument Config", "Exp Time",
+                   "Filters/Gratings", "Apertures", "Central Wavelength"]
+
+# Columns of the archive csv the prepared archive is derived from; the others are never read
+source_columns = ["Start Time", "obstype", "Instrument Config", "Exp Time",
+                  "Filters/Gratings", "Apertures", "Central Wavelength"]
+
+# String dimensions stored as pandas Categoricals (integer codes plus a lookup table)
+categorical_columns = ["obstype", "Instrument Config", "Filters/Gratings", "Apertures"]
+
+# Numeric columns stored as float32 with the lean_archive option
+lean_columns = ["Decimal Year", "Exp Time", "Central Wavelength"]
+
+# The prepared archive, its summary and cubes are loaded once per process and
+# shared by every tab. They are swapped as a single dict so a callback that holds
+# a snapshot never mixes two versions of the archive.
+_dataset = None
+_load_lock = threading.Lock()
+
+# Functions called with every newly published dataset, e.g. to precompute figures
+publish_hooks = []
+
+# Dimensions with a precomputed aggregation cube (see inspector.cube)
+cube_columns = ["Filters/Gratings", "Apertures"]
+
+
+def archive_source():
+    """Return the path or URL of the archive csv selected by the config"""
+    if config['inspector']['use_apache']:
+        return config['inspector']['apache_url']
+    return config['inspector']['outdir'] + config['inspector']['csv_name']
+
+
+def read_source(source, year_range=None):
+    """Read the columns of the archive csv that the inspector uses, with compact string dimensions.
+
+    With year_range = [start, end) only the observations of those whole years
+    are returned. When the per-year partitions written by the MAST fetch still
+    match the csv they are read instead, so the other years never leave the disk.
+    """
+    dtype = {column: 'category' for column in categorical_columns}
+    outdir = config['inspector']['outdir']
+    if year_range is None:
+        return generate_dataframe_from_csv(source, columns=source_columns, dtype=dtype)
+    if source == outdir + config['inspector']['csv_name'] and partitions_match(outdir, source):
+        return read_partitions(outdir, year_range, columns=source_columns, dtype=dtype)
+
+    mast = generate_dataframe_from_csv(source, columns=source_columns, dtype=dtype)
+    years = pd.to_datetime(mast['Start Time'], format="%Y-%m-%d %H:%M:%S").dt.year
+    mast = mast[(years >= year_range[0]) & (years < year_range[1])].reset_index(drop=True)
+    if len(mast) == 0:
+        raise ValueError('No observations in the years {} of {}'.format(year_range, source))
+    return mast
+
+
+def prepare_archive(mast, lean=None):
+    """Derive the columns used by the inspector tabs from a raw archive DataFrame.
+
+    With lean=True (default: the lean_archive option) the numeric columns are
+    stored as float32, halving their memory; decimal years are then accurate
+    to about an hour.
+    """
+    if lean is None:
+        lean = config['inspector']['lean_archive']
+    start_times = pd.to_datetime(mast['Start Time'], format="%Y-%m-%d %H:%M:%S")
+
+    archive = mast[[column for column in archive_columns if column in mast]].copy()
+    # Convert Start Times to Decimal Years
+    archive['Decimal Year'] = dec_year(start_times)
+    archive['Instrument Config'] = archive['Instrument Config'].str.strip()
+    # Keep the archive sorted by time so date ranges are contiguous row slices
+    archive = archive[archive_columns].sort_values('Decimal Year', kind='mergesort')
+    archive = archive.reset_index(drop=True)
+    for column in categorical_columns:
+        archive[column] = archive[column].astype('category')
+    if lean:
+        # Rounding keeps the sort order of the decimal years
+        for column in lean_columns:
+            archive[column] = archive[column].astype(np.float32)
+
+    summary = {'n_obs': len(mast),
+               'exptime': np.sum(mast['Exp Time']),
+               'earliest': min(mast['Start Time']),
+               'latest': max(mast['Start Time'])}
+
+    return archive, summary
+
+
+def local_source(source):
+    """Return the local csv path for a source, downloading remote archives through the cache.
+
+    Only http(s) and ftp URLs are downloaded; anything else is a local path, so a
+    missing csv raises FileNotFoundError.
+    """
+    if parse.urlparse(source).scheme in ('http', 'https', 'ftp'):
+        # Remote archives are read from a local download cache
+        source = download_archive(source)
+    return source
+
+
+def source_signature(source):
+    """Return the local path, mtime and size identifying the current source csv"""
+    source = local_source(source)
+    signature = cache.file_signature(source)
+    return source, signature['mtime'], signature['size']
+
+
+def source_hash(signature):
+    """Return the content hash of the source csv with the given signature.
+
+    The cache manifest's hash is used when it describes the same file, so the
+    csv is only hashed again when it is not cached.
+    """
+    path, mtime, size = signature
+    manifest = cache.read_manifest()
+    if (manifest is not None and manifest['source'] == path
+            and (manifest['mtime'], manifest['size']) == (mtime, size)):
+        return manifest['sha256']
+    return cache.content_hash(path)
+
+
+def read_archive(source, rebuild_cache=False, mmap=False, lean=None, year_range=None):
+    """Return the prepared archive and its summary, from the cache when it is fresh.
+
+    The prepared archive is cached on disk and reused for as long as the source
+    csv is unchanged and was prepared with the same lean setting; pass
+    rebuild_cache=True to always re-parse the csv. With mmap=True the archive
+    columns are served as read-only maps of the cache files (see cache.read_cache).
+
+    With year_range = [start, end) only those whole years are read and prepared
+    (see read_source); the cache holds the whole archive, so it is not used.
+    """
+    if lean is None:
+        lean = config['inspector']['lean_archive']
+    source = local_source(source)
+    if year_range is not None:
+        return prepare_archive(read_source(source, year_range), lean)
+    signature = cache.file_signature(source)
+
+    manifest = cache.read_manifest()
+    if (not rebuild_cache and cache.is_fresh(manifest, source, signature)
+            and manifest.get('lean', False) == lean):
+        if manifest['mtime'] != signature['mtime']:
+            # Same contents with a new mtime, e.g. downloaded again unchanged
+            try:
+                manifest = cache.update_signature(manifest, signature)
+            except OSError as e:
+                logger.warning('Could not update the archive cache manifest: %s', e)
+        try:
+            return cache.read_cache(manifest, mmap=mmap)
+        except (OSError, ValueError) as e:
+            # The cache was replaced while it was being read
+            logger.warning('Could not read the archive cache, rebuilding it: %s', e)
+
+    archive, summary = prepare_archive(read_source(source), lean)
+    try:
+        cache.write_cache(archive, summary, source, cache.content_hash(source), signature, lean=lean)
+    except OSError as e:
+        logger.warning('Could not write the archive cache: %s', e)
+        return archive, summary
+
+    if mmap:
+        # Serve the freshly written files rather than this process's private copy
+        manifest = cache.read_manifest()
+        if cache.is_fresh(manifest, source, signature):
+            return cache.read_cache(manifest, mmap=True)
+    return archive, summary
+
+
+def build_dataset(source=None, rebuild_cache=False, mmap=None, year_range=None):
+    """Read the archive and derive everything the tabs need, without publishing it.
+
+    year_range = [start, end) (default: the year_range option) limits the
+    dataset to those whole years; the archive is then not memory-mapped.
+    """
+    if source is None:
+        source = archive_source()
+    if year_range is None:
+        year_range = config['inspector']['year_range']
+    if mmap is None:
+        mmap = config['inspector']['serve_mmap']
+    mmap = mmap and year_range is None
+    signature = source_signature(source)
+    archive, summary = read_archive(source, rebuild_cache, mmap, year_range=year_range)
+
+    return {'source': source,
+            'signature': signature,
+            'sha256': source_hash(signature),
+            'mmap': mmap,
+            'year_range': year_range,
+            'version': 0,
+            'archive': archive,
+            'summary': summary,
+            'years': np.unique(np.floor(archive['Decimal Year'].values).astype(int)),
+            'cubes': {column: build_cube(archive, column) for column in cube_columns}}
+
+
+def _publish(dataset):
+    """Atomically replace the shared dataset, then run the publish hooks on it"""
+    global _dataset
+
+    dataset['version'] = 1 if _dataset is None else _dataset['version'] + 1
+    _dataset = dataset
+    for hook in publish_hooks:
+        hook(dataset)
+
+
+def load_archive(source=None, rebuild_cache=False, mmap=None, year_range=None):
+    """Read and prepare the archive and its cubes, replacing any previously loaded copy"""
+    with _load_lock:
+        _publish(build_dataset(source, rebuild_cache, mmap, year_range))
+    return _dataset['archive']
+
+
+def refresh_archive():
+    """Reload the archive if its source has changed since it was loaded.
+
+    The new dataset is built completely before it replaces the old one, so
+    callbacks keep being served from the previous version in the meantime.
+    The source only counts as changed when its contents differ: a csv that was
+    touched, or downloaded again with the same bytes, keeps the current version
+    and its figure caches. Returns True if a new version was published.
+    """
+    dataset = get_dataset()
+    signature = source_signature(dataset['source'])
+    if signature == dataset['signature']:
+        return False
+    if cache.content_hash(signature[0]) == dataset['sha256']:
+        # Remember the new mtime so the file is not hashed again on every check
+        dataset['signature'] = signature
+        return False
+    with _load_lock:
+        _publish(build_dataset(dataset['source'], mmap=dataset['mmap'], year_range=dataset['year_range']))
+    logger.info('Reloaded archive version %d', _dataset['version'])
+    return True
+
+
+def start_refresher(interval=None):
+    """Start a daemon thread checking for a new archive every interval seconds.
+
+    Returns the thread, or None when reloading is disabled (interval of 0).
+    """
+    if interval is None:
+        interval = config['inspector']['reload_interval']
+    if not interval:
+        return None
+
+    def refresh_loop():
+        while True:
+            time.sleep(interval)
+            try:
+                refresh_archive()
+            except Exception:
+                logger.exception('Archive reload failed, keeping the current version')
+
+    thread = threading.Thread(target=refresh_loop, name='archive-refresher', daemon=True)
+    thread.start()
+    return thread
+
+
+def year_slice(archive, year_range):
+    """Return the rows of the time-sorted archive with year_range[0] <= Decimal Year < year_range[1]"""
+    start, stop = np.searchsorted(archive['Decimal Year'].values, year_range[:2], side='left')
+    return archive.iloc[start:stop]
+
+
+def category_mask(column, values):
+    """Boolean mask of the rows of a categorical column whose value is in values.
+
+    The selection is translated to category codes once, so the comparison runs
+    on small integers instead of strings.
+    """
+    codes = column.cat.categories.get_indexer(list(values))
+    # One extra trailing slot so missing values (code -1) are never selected
+    selected = np.zeros(len(column.cat.categories) + 1, dtype=bool)
+    selected[codes[codes >= 0]] = True
+    return selected[column.cat.codes.values]
+
+
+def get_dataset():
+    """Return the current shared dataset, loading it on first use.
+
+    The dict holds 'archive', 'summary', 'cubes', the observed 'years' and a
+    'version' counter that
+    increases with every reload. Hold on to the returned dict to work on one
+    consistent snapshot.
+    """
+    if _dataset is None:
+        with _load_lock:
+            if _dataset is None:
+                _publish(build_dataset())
+    return _dataset
+
+
+def get_archive():
+    """Return the shared prepared archive, loading it on first use.
+
+    The returned DataFrame is shared between all callbacks and must be treated
+    as read-only.
+    """
+    return get_dataset()['archive']
+
+
+def get_summary():
+    """Return the overview statistics of the shared archive"""
+    return get_dataset()['summary']
+
+
+def get_cube(column):
+    """Return the shared aggregation cube for 'Filters/Gratings' or 'Apertures'"""
+    return get_dataset()['cubes'][column]
+
+
+def process_memory():
+    """Return the resident memory of this process in bytes, or its peak where that is unavailable"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def memory_report(dataset=None):
+    """Return the bytes held by every archive column, the whole archive, the cubes and the process.
+
+    Memory-mapped columns (serve_mmap) are counted at their full size although
+    they live in the OS page cache, shared between processes.
+    """
+    if dataset is None:
+        dataset = get_dataset()
+    archive = dataset['archive']
+    columns = {column: int(archive[column].memory_usage(index=False, deep=True))
+               for column in archive.columns}
+    return {'columns': columns,
+            'dtypes': {column: str(archive[column].dtype) for column in archive.columns},
+            'archive_bytes': sum(columns.values()),
+            'cube_bytes': sum(cube['counts'].nbytes + cube['exptime'].nbytes
+                              for cube in dataset['cubes'].values()),
+            'process_bytes': process_memory()}
+
+
+def format_memory_report(report):
+    """Return a memory report as a table, one line per column"""
+    lines = [f"{'column':<20} {'dtype':<10} {'MiB':>9}"]
+    for column, size in report['columns'].items():
+        lines.append(f"{column:<20} {report['dtypes'][column]:<10} {size/2**20:9.2f}")
+    lines.append(f"{'archive':<31} {report['archive_bytes']/2**20:9.2f}")
+    lines.append(f"{'cubes':<31} {report['cube_bytes']/2**20:9.2f}")
+    if report['process_bytes'] is not None:
+        lines.append(f"{'process':<31} {report['process_bytes']/2**20:9.2f}")
+    return '\n'.join(lines)
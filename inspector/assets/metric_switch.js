@@ -0,0 +1,13 @@
+// Switch the figures between metrics in the browser. The figure callbacks send a
+// figure for every metric ({"n-obs": figure, "exptime": figure}) to a dcc.Store,
+// so changing a metric dropdown needs no request to the server.
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    inspector: {
+        select_metric: function(figures, metric) {
+            if (!figures || !figures[metric]) {
+                return window.dash_clientside.no_update;
+            }
+            return figures[metric];
+        }
+    }
+});
@@ -0,0 +1,153 @@
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from .config import config
+
+# Bump when the layout of the cache directory changes
+cache_version = 3
+
+
+def cache_dir():
+    """Return the directory holding the prepared archive cache"""
+    return os.path.join(config['inspector']['outdir'], config['inspector']['cache_dir'])
+
+
+def content_hash(data):
+    """Return the sha256 hex digest of a bytes object or of a file on disk"""
+    sha = hashlib.sha256()
+    if isinstance(data, bytes):
+        sha.update(data)
+    else:
+        with open(data, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                sha.update(chunk)
+    return sha.hexdigest()
+
+
+def file_signature(path):
+    """Return the mtime and size of a source file, used to detect changes cheaply"""
+    stat = os.stat(path)
+    return {'mtime': stat.st_mtime, 'size': stat.st_size}
+
+
+def read_manifest(directory=None):
+    """Return the cache manifest, or None if there is no complete cache"""
+    if directory is None:
+        directory = cache_dir()
+    try:
+        with open(os.path.join(directory, 'manifest.json')) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('version') != cache_version:
+        return None
+    return manifest
+
+
+def is_fresh(manifest, source, signature=None, sha256=None):
+    """Check whether a cache manifest still describes the given source.
+
+    A source of a different size has changed; otherwise the content hash
+    decides, so a file that was only touched or re-downloaded with the same
+    bytes (a new mtime) still matches. Pass sha256 if it is already known.
+    """
+    if manifest is None or manifest['source'] != source:
+        return False
+    if signature is not None and manifest['size'] != signature['size']:
+        return False
+    if sha256 is None:
+        sha256 = content_hash(source)
+    return manifest['sha256'] == sha256
+
+
+def update_signature(manifest, signature, directory=None):
+    """Record the new mtime of an unchanged source in the cache manifest"""
+    if directory is None:
+        directory = cache_dir()
+    manifest = dict(manifest, mtime=signature['mtime'], size=signature['size'])
+    tmp_name = os.path.join(directory, f'manifest.json.{os.getpid()}.tmp')
+    with open(tmp_name, 'w') as f:
+        json.dump(manifest, f, default=str)
+    os.replace(tmp_name, os.path.join(directory, 'manifest.json'))
+    return manifest
+
+
+def write_cache(archive, summary, source, sha256, signature=None, directory=None, lean=False):
+    """Write the prepared archive as one .npy file per column plus a manifest.
+
+    The cache is assembled in a private directory and then moved into place, so
+    several server processes rebuilding at once never see each other's partial
+    files, and processes still mapping the previous files keep their pages.
+
+    Columns keep their dtype, so a lean (float32) archive is cached as float32;
+    lean is recorded in the manifest so the other setting does not reuse it.
+    """
+    if directory is None:
+        directory = cache_dir()
+    final_directory = directory
+    directory = f'{final_directory}.{os.getpid()}.tmp'
+    if os.path.isdir(directory):
+        shutil.rmtree(directory)
+    os.makedirs(directory)
+
+    columns = {}
+    for i, column in enumerate(archive.columns):
+        entry = {'file': f'column{i}.npy'}
+        if pd.api.types.is_numeric_dtype(archive[column]):
+            values = archive[column].values
+        else:
+            # String columns are stored as integer codes plus their categories
+            categorical = archive[column].astype('category')
+            values = categorical.cat.codes.values
+            entry['categories'] = list(categorical.cat.categories)
+        np.save(os.path.join(directory, entry['file']), values)
+        columns[column] = entry
+
+    manifest = {'version': cache_version,
+                'source': source,
+                'sha256': sha256,
+                'mtime': signature['mtime'] if signature else None,
+                'size': signature['size'] if signature else None,
+                'lean': lean,
+                'columns': columns,
+                'summary': summary}
+
+    # The manifest is written last so an interrupted write leaves no valid cache
+    tmp_name = os.path.join(directory, 'manifest.json.tmp')
+    with open(tmp_name, 'w') as f:
+        json.dump(manifest, f, default=str)
+    os.replace(tmp_name, os.path.join(directory, 'manifest.json'))
+
+    if os.path.isdir(final_directory):
+        shutil.rmtree(final_directory, ignore_errors=True)
+    try:
+        os.rename(directory, final_directory)
+    except OSError:
+        # Another process installed its (equivalent) cache first
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def read_cache(manifest, directory=None, mmap=False):
+    """Load the prepared archive and its summary from the cache.
+
+    With mmap=True the numeric columns stay read-only memory maps of the cache
+    files instead of private copies, so every process serving the archive shares
+    the same pages of the OS page cache. This needs pandas >= 2, which does not
+    consolidate same-dtype columns into one private block when copy=False.
+    """
+    if directory is None:
+        directory = cache_dir()
+
+    archive = {}
+    for column, entry in manifest['columns'].items():
+        values = np.load(os.path.join(directory, entry['file']), mmap_mode='r')
+        if 'categories' in entry:
+            values = pd.Categorical.from_codes(values, entry['categories'])
+        archive[column] = values
+
+    return pd.DataFrame(archive, copy=not mmap), manifest['summary']
@@ -3,9 +3,31 @@ config = {
     "inspector":{
         "outdir":"./",
         "csv_name":"stis_archive.csv",
+        "cache_dir":"stis_archive_cache",
+        "partition_dir":"stis_archive_partitions",
         "use_apache":True,
+        "apache_url":"https://www.stsci.edu/~STIS/stis_archive.csv",
+        "download_name":"stis_archive_apache.csv",
+        "download_max_age":3600,
+        "reload_interval":900,
+        "serve_mmap":False,
+        "lean_archive":False,
+        "year_range":None,
+        "figure_cache_size":256,
+        "figure_digits":6,
+        "compress_min_size":1024,
+        "slow_callback_seconds":1.0,
+        "log_level":"INFO",
+        "profile":False,
+        "profile_dir":"stis_archive_profiles",
+        "profile_sample_rate":1.0,
         "gen_csv":False,
         "datatype":"S",
+        "mast_url":"https://archive.stsci.edu/hst/search.php",
+        "fetch_workers":4,
+        "fetch_timeout":120,
+        "fetch_retries":3,
+        "fetch_backoff":2.0,
         "instrument":"STIS",
         "stylesheets":['https://codepen.io/chriddyp/pen/bWLwgP.css'],
         "mast":[]
@@ -0,0 +1,96 @@
+import numpy as np
+import pandas as pd
+
+# Dimensions shared by every cube; the last axis is the tab-specific dimension
+cube_dimensions = ["Instrument Config", "obstype"]
+
+
+def factorize(values):
+    """Return integer codes and sorted labels for a column.
+
+    Missing values get their own trailing label of None so they are still
+    counted in totals that do not select on this column.
+    """
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes, labels = values.cat.codes.values, list(values.cat.categories)
+    else:
+        codes, labels = pd.factorize(values, sort=True)
+        labels = list(labels)
+    if (codes < 0).any():
+        codes = np.where(codes < 0, len(labels), codes)
+        labels.append(None)
+    return codes, labels
+
+
+def build_cube(archive, dimension):
+    """Count observations and sum exposure times per year x detector x obstype x dimension.
+
+    Years are whole-year bins [year, year + 1) of the archive 'Decimal Year'.
+    """
+    years = np.floor(archive['Decimal Year'].values).astype(int)
+    first_year = years.min() if len(years) else 0
+    last_year = years.max() if len(years) else -1
+
+    axes = {'year': np.arange(first_year, last_year + 1)}
+    codes = [years - first_year]
+    for column in cube_dimensions + [dimension]:
+        column_codes, axes[column] = factorize(archive[column])
+        codes.append(column_codes)
+
+    shape = tuple(len(axis) for axis in axes.values())
+    size = int(np.prod(shape))
+    flat_index = np.ravel_multi_index(codes, shape) if size else np.zeros(0, dtype=int)
+    exptimes = np.nan_to_num(archive['Exp Time'].values.astype(float))
+
+    return {'dimension': dimension,
+            'axes': axes,
+            'counts': np.bincount(flat_index, minlength=size).reshape(shape),
+            'exptime': np.bincount(flat_index, weights=exptimes, minlength=size).reshape(shape)}
+
+
+def _axis_mask(labels, selected):
+    """Boolean mask of the cube labels that are in a selection (None selects all)"""
+    if selected is None:
+        return np.ones(len(labels), dtype=bool)
+    return np.isin(np.array(labels, dtype=object), list(selected))
+
+
+def select_cube(cube, year_range, detectors=None, obstypes=None):
+    """Sum a cube over a year range and the selected detectors and obstypes.
+
+    The year range is half-open, [year_range[0], year_range[1]), in whole years.
+    Returns the observation counts and total exposure times (seconds) as Series
+    indexed by the labels of the cube's last dimension.
+    """
+    axes = cube['axes']
+    years = axes['year']
+    year_mask = (years >= np.floor(year_range[0])) & (years < np.ceil(year_range[1]))
+    detector_mask = _axis_mask(axes['Instrument Config'], detectors)
+    obstype_mask = _axis_mask(axes['obstype'], obstypes)
+
+    totals = []
+    for values in (cube['counts'], cube['exptime']):
+        values = values[year_mask][:, detector_mask][:, :, obstype_mask]
+        totals.append(pd.Series(values.sum(axis=(0, 1, 2)), index=axes[cube['dimension']]))
+
+    return totals[0], totals[1]
+
+
+def detector_totals(cube, year_range):
+    """Sum a cube over a year range for every detector observed in that range.
+
+    Returns the observation counts and total exposure times (seconds) as Series
+    indexed by detector.
+    """
+    axes = cube['axes']
+    years = axes['year']
+    year_mask = (years >= np.floor(year_range[0])) & (years < np.ceil(year_range[1]))
+
+    counts = cube['counts'][year_mask].sum(axis=(0, 2, 3))
+    exptime = cube['exptime'][year_mask].sum(axis=(0, 2, 3))
+    observed = (counts > 0) & np.array([label is not None for label in axes['Instrument Config']],
+                                       dtype=bool)
+    detectors = [label for label, keep in zip(axes['Instrument Config'], observed) if keep]
+
+    return (pd.Series(counts[observed], index=detectors),
+            pd.Series(exptime[observed], index=detectors))
@@ -0,0 +1,88 @@
+import json
+import logging
+import os
+import time
+from urllib import error, request
+
+from .config import config
+
+logger = logging.getLogger(__name__)
+
+
+def download_path():
+    """Return the local path of the cached copy of the downloaded archive"""
+    return os.path.join(config['inspector']['outdir'], config['inspector']['download_name'])
+
+
+def _read_meta(meta_path):
+    """Return the validators and fetch time stored for a cached download"""
+    try:
+        with open(meta_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_meta(meta, meta_path):
+    """Write the download metadata atomically"""
+    tmp_path = meta_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, meta_path)
+
+
+def download_archive(url, path=None, max_age=None, timeout=None, urlopen=None):
+    """Download the archive csv to a local cache, returning the local path.
+
+    A cached copy younger than max_age seconds is used without contacting the
+    host. Otherwise the request carries If-None-Match / If-Modified-Since so an
+    unchanged file is answered with 304 and not transferred again. If the host
+    cannot be reached the last good copy is returned.
+
+    urlopen is the HTTP layer (urllib.request.urlopen by default); any callable
+    with the same signature and response interface can be passed in.
+    """
+    inspector_config = config['inspector']
+    path = download_path() if path is None else path
+    max_age = inspector_config['download_max_age'] if max_age is None else max_age
+    timeout = inspector_config['fetch_timeout'] if timeout is None else timeout
+    urlopen = request.urlopen if urlopen is None else urlopen
+
+    meta_path = path + '.meta.json'
+    meta = _read_meta(meta_path) if os.path.exists(path) else {}
+    if meta.get('url') != url:
+        meta = {}
+
+    if meta and time.time() - meta.get('checked', 0) < max_age:
+        return path
+
+    headers = {}
+    if meta.get('etag'):
+        headers['If-None-Match'] = meta['etag']
+    if meta.get('last_modified'):
+        headers['If-Modified-Since'] = meta['last_modified']
+
+    try:
+        with urlopen(request.Request(url, headers=headers), timeout=timeout) as response:
+            data = response.read()
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+    except OSError as e:
+        if isinstance(e, error.HTTPError) and e.code == 304 and meta:
+            # Not modified: the cached copy is still current
+            meta['checked'] = time.time()
+            _write_meta(meta, meta_path)
+            return path
+        if not meta:
+            raise
+        logger.warning('Could not download %s (%s); using the copy from %s', url, e, time.ctime(meta['checked']))
+        return path
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    _write_meta({'url': url, 'etag': etag, 'last_modified': last_modified,
+                 'checked': time.time()}, meta_path)
+
+    return path
@@ -1,88 +1,405 @@
+import io
+import json
+import logging
+import os
+import shutil
 import pandas as pd
 import numpy as np
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
-from urllib import parse, request
+from urllib import error, parse, request
 
+from .config import config
 from .server import app
 
-def generate_dataframe_from_csv(csv_name):
-    """Generate a Pandas DataFrame from an existing csv metadata file"""
-    mast = pd.read_csv(csv_name, low_memory=False)
+logger = logging.getLogger(__name__)
+
+# Output columns
+selectedColumnsCsv = \
+    'sci_data_set_name,' + \
+    'sci_obset_id,' + \
+    'sci_targname,' + \
+    'sci_start_time,' + \
+    'sci_stop_time,' + \
+    'sci_actual_duration,' + \
+    'sci_instrume,' + \
+    'sci_instrument_config,' + \
+    'sci_operating_mode,' + \
+    'sci_aper_1234,' + \
+    'sci_spec_1234,' + \
+    'sci_central_wavelength,' + \
+    'sci_fgslock,' + \
+    'sci_mtflag,' + \
+    'sci_pep_id,' + \
+    'sci_aec,' + \
+    'sci_obs_type,' + \
+    'scp_scan_type'
+
+# Column holding the unique dataset name (sci_data_set_name)
+dataset_column = 'Dataset'
+
+
+def generate_dataframe_from_csv(csv_name, columns=None, dtype=None):
+    """Generate a Pandas DataFrame from an existing csv metadata file.
+
+    With columns, only those of the csv's columns are parsed, and dtype maps
+    columns to the dtypes they are parsed into (e.g. 'category'), so unused and
+    wide string columns are never held in memory.
+    """
+    if columns is not None:
+        return pd.read_csv(csv_name, usecols=lambda column: column in columns, dtype=dtype,
+                           low_memory=False)
+    mast = pd.read_csv(csv_name, dtype=dtype, low_memory=False)
     mast = mast[mast.keys()[1:]]
 
     return mast
 
 
-def generate_csv_from_mast(csv_name, outdir, datatype, instrument):
-    """Generate a csv file of the STIS archive from querying MAST"""
+def _is_transient(e):
+    """Return whether a failed request is worth retrying: connection errors, timeouts and 5xx responses"""
+    if isinstance(e, error.HTTPError):
+        return e.code >= 500
+    return isinstance(e, (error.URLError, TimeoutError, ConnectionError))
+
+
+def fetch_year(year, instrument, datatype, start=None, url=None, timeout=None, retries=None,
+               backoff=None):
+    """Query MAST for one year of observations, retrying failed requests.
+
+    The query covers start (default 'Jan 1 <year>') up to the end of the year.
+    Returns None for years without any data. Connection errors, timeouts and
+    server errors (5xx) are retried with exponential backoff and re-raised once
+    the retries are used up; other errors, such as a 4xx response, are raised at once.
+    """
+    inspector_config = config['inspector']
+    url = inspector_config['mast_url'] if url is None else url
+    timeout = inspector_config['fetch_timeout'] if timeout is None else timeout
+    retries = inspector_config['fetch_retries'] if retries is None else retries
+    backoff = inspector_config['fetch_backoff'] if backoff is None else backoff
+    start = 'Jan 1 {}'.format(year) if start is None else start
+
+    data = [
+        ('sci_instrume', instrument),
+        ('sci_aec', datatype),
+        ('sci_start_time', '{} .. Jan 1 {}'.format(start, year + 1)),
+        ('max_records', '25000'),
+        ('ordercolumn1', 'sci_start_time'),
+        ('outputformat', 'JSON'),
+        ('selectedColumnsCsv', selectedColumnsCsv),
+        ('nonull', 'on'),
+        ('action', 'Search'), ]
+    full_url = url + '?' + parse.urlencode(data)
 
-     # Determine if we want 'science', 'calibration', or 'all' datasets:
+    for attempt in range(retries + 1):
+        try:
+            with request.urlopen(full_url, timeout=timeout) as response:
+                json_file = response.read()
+            break
+        except OSError as e:
+            if attempt == retries or not _is_transient(e):
+                raise
+            delay = backoff * 2**attempt
+            logger.warning('Retrying %s in %.1fs after error: %s', year, delay, e)
+            time.sleep(delay)
+
+    # Convert to Pandas table:
+    try:
+        mast = pd.read_json(io.StringIO(json_file.decode()))
+    except ValueError:
+        return None  # Sad years with no data
+    # An empty year comes back as [], a frame without any columns
+    return None if mast.empty else mast
+
+
+def _timed_fetch_year(year, *args, **kwargs):
+    """Run fetch_year and also return how long it took in seconds"""
+    start = time.time()
+    return fetch_year(year, *args, **kwargs), time.time() - start
+
+
+def _check_datatype(datatype):
+    """Determine if we want 'science', 'calibration', or 'all' datasets"""
     datatype = datatype.upper()
     assert datatype in ['S', 'C', '%','ALL'], "'datatype' is not a valid selection."
     if datatype == 'ALL':
         datatype = '%'
+    return datatype
 
-    url = 'https://archive.stsci.edu/hst/search.php'
-
-    # Output columns
-    selectedColumnsCsv = \
-        'sci_data_set_name,' + \
-        'sci_obset_id,' + \
-        'sci_targname,' + \
-        'sci_start_time,' + \
-        'sci_stop_time,' + \
-        'sci_actual_duration,' + \
-        'sci_instrume,' + \
-        'sci_instrument_config,' + \
-        'sci_operating_mode,' + \
-        'sci_aper_1234,' + \
-        'sci_spec_1234,' + \
-        'sci_central_wavelength,' + \
-        'sci_fgslock,' + \
-        'sci_mtflag,' + \
-        'sci_pep_id,' + \
-        'sci_aec,' + \
-        'sci_obs_type,' + \
-        'scp_scan_type'
-
-    # Loop year-by-year to avoid data limits:
-    all_years = []
-    for year in np.arange(1997, datetime.now().year + 1):
-        print('Working on {}...'.format(year))
-        data = [
-            ('sci_instrume', instrument),
-            ('sci_aec', datatype),
-            ('sci_start_time', 'Jan 1 {} .. Jan 1 {}'.format(year, year + 1)),
-            ('max_records', '25000'),
-            ('ordercolumn1', 'sci_start_time'),
-            ('outputformat', 'JSON'),
-            ('selectedColumnsCsv', selectedColumnsCsv),
-            ('nonull', 'on'),
-            ('action', 'Search'), ]
 
-        try:
-            url_values = parse.urlencode(data)
-            full_url = url + '?' + url_values
-            # print (full_url)
-            with request.urlopen(full_url) as response:
-                json_file = response.read()
+def fetch_years(years, instrument, datatype, max_workers=None, first_start=None,
+                handle_year=None, handle_error=None, **fetch_kwargs):
+    """Query MAST for each of the given years concurrently.
+
+    Years are fetched by up to max_workers threads; first_start optionally
+    narrows the query of the first year. Each year's result is passed to
+    handle_year(year, result) as soon as it arrives and only the return value
+    is kept, so a handler that writes the year out bounds memory to the years in
+    flight. Returns the kept non-None values in year order.
+
+    A year that still fails after its retries is passed to handle_error(year, error)
+    while the other years carry on; a RuntimeError naming the failed years is
+    raised once all of them have finished.
+    """
+    if max_workers is None:
+        max_workers = config['inspector']['fetch_workers']
+    if handle_year is None:
+        handle_year = lambda year, result: result
 
-            # Convert to Pandas table:
-            all_years.append(pd.read_json(json_file.decode()))
-        except ValueError:
-            pass  # Sad years with no data
+    all_years = {}
+    failed = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        for year in years:
+            start = first_start if year == years[0] else None
+            futures[executor.submit(_timed_fetch_year, int(year), instrument, datatype,
+                                    start=start, **fetch_kwargs)] = year
+        for future in as_completed(futures):
+            year = futures.pop(future)
+            try:
+                result, duration = future.result()
+            except Exception as e:
+                failed.append(year)
+                all_years[year] = None
+                if handle_error is not None:
+                    handle_error(year, e)
+                logger.error('Failed %s: %s [%d/%d]', year, e, len(all_years), len(years))
+                continue
+            n_rows = 0 if result is None else len(result)
+            all_years[year] = handle_year(year, result)
+            logger.info('Finished %s (%d observations) in %.1fs [%d/%d]',
+                        year, n_rows, duration, len(all_years), len(years))
 
-    # Concatenate individual years together:
-    mast = pd.concat(all_years)
+    if failed:
+        raise RuntimeError('Could not fetch {}'.format(', '.join(str(year) for year in sorted(failed))))
+    return [all_years[year] for year in years if all_years[year] is not None]
 
-    # Modify/add some rows:
-    mast['Start Time'] = [datetime.strptime(
-        x, '%Y-%m-%d %H:%M:%S') for x in mast['Start Time']]
+
+def normalize_mast(mast):
+    """Parse start times, derive obstypes and drop acquisitions from raw MAST results"""
+    mast = mast.copy()
+    mast['Start Time'] = pd.to_datetime(mast['Start Time'], format='%Y-%m-%d %H:%M:%S')
     mast['obstype'] = [
         'Imaging' if 'MIR' in x else 'Spectroscopic' for x in mast['Filters/Gratings']]
     mast.loc[mast['Apertures'] == '50CORON', 'obstype'] = 'Coronagraphic'
     mast['Instrument Config'] = [x.strip()
                                     for x in mast['Instrument Config']]
 
-    mast = mast[(mast['Operating Mode'] != 'ACQ') & (mast['Operating Mode'] != 'ACQ/PEAK')]
-    mast.to_csv(outdir+csv_name)
+    return mast[(mast['Operating Mode'] != 'ACQ') & (mast['Operating Mode'] != 'ACQ/PEAK')]
+
+
+def write_csv(mast, csv_path):
+    """Write the archive csv atomically, so readers never see a partial file"""
+    tmp_path = csv_path + '.tmp'
+    mast.reset_index(drop=True).to_csv(tmp_path)
+    os.replace(tmp_path, csv_path)
+
+
+def partition_dir(outdir):
+    """Return the directory holding the per-year archive partitions"""
+    return os.path.join(outdir, config['inspector']['partition_dir'])
+
+
+def partition_path(outdir, year):
+    """Return the path of the archive partition holding one year of observations"""
+    return os.path.join(partition_dir(outdir), '{}.csv'.format(year))
+
+
+def write_partition(mast, outdir, year):
+    """Write (or, for an empty year, remove) the archive partition of one year"""
+    path = partition_path(outdir, year)
+    if mast is None or len(mast) == 0:
+        if os.path.exists(path):
+            os.remove(path)
+        return None
+    os.makedirs(partition_dir(outdir), exist_ok=True)
+    write_csv(mast, path)
+    return path
+
+
+def partition_years(outdir):
+    """Return the sorted years that have an archive partition on disk"""
+    if not os.path.isdir(partition_dir(outdir)):
+        return []
+    return sorted(int(name[:-4]) for name in os.listdir(partition_dir(outdir))
+                  if name.endswith('.csv') and name[:-4].isdigit())
+
+
+def read_partitions(outdir, year_range=None, columns=None, dtype=None):
+    """Read the archive from its per-year partitions.
+
+    Only the partitions of the years in year_range = [start, end) are read, with
+    the columns and dtype of generate_dataframe_from_csv.
+    """
+    years = partition_years(outdir)
+    if year_range is not None:
+        years = [year for year in years if year_range[0] <= year < year_range[1]]
+    if not years:
+        raise FileNotFoundError('No archive partitions for {} in {}'.format(
+            year_range, partition_dir(outdir)))
+    return pd.concat([generate_dataframe_from_csv(partition_path(outdir, year), columns, dtype)
+                      for year in years], ignore_index=True)
+
+
+def combine_partitions(outdir, csv_path, years):
+    """Concatenate the partitions of the given years into one csv, one year at a time"""
+    tmp_path = csv_path + '.tmp'
+    columns = None
+    offset = 0
+    for year in years:
+        path = partition_path(outdir, year)
+        if not os.path.exists(path):
+            continue
+        mast = generate_dataframe_from_csv(path)
+        if columns is None:
+            columns = list(mast.columns)
+        mast = mast.reindex(columns=columns)
+        mast.index += offset
+        mast.to_csv(tmp_path, mode='w' if offset == 0 else 'a', header=offset == 0)
+        offset += len(mast)
+    os.replace(tmp_path, csv_path)
+
+
+def fetch_manifest_path(outdir):
+    """Return the path of the manifest checkpointing a partitioned fetch"""
+    return os.path.join(partition_dir(outdir), 'manifest.json')
+
+
+def read_fetch_manifest(outdir):
+    """Return the fetch manifest, or None if there is no readable manifest"""
+    try:
+        with open(fetch_manifest_path(outdir)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_fetch_manifest(manifest, outdir):
+    """Write the fetch manifest atomically"""
+    os.makedirs(partition_dir(outdir), exist_ok=True)
+    tmp_path = fetch_manifest_path(outdir) + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp_path, fetch_manifest_path(outdir))
+
+
+def csv_signature(csv_path):
+    """Return the mtime and size of the archive csv, as recorded in the fetch manifest"""
+    stat = os.stat(csv_path)
+    return {'mtime': stat.st_mtime, 'size': stat.st_size}
+
+
+def record_csv(outdir, csv_path):
+    """Record in the fetch manifest that the partitions hold the observations of the csv as it is now"""
+    manifest = read_fetch_manifest(outdir)
+    if manifest is not None:
+        manifest['csv'] = csv_signature(csv_path)
+        write_fetch_manifest(manifest, outdir)
+
+
+def partitions_match(outdir, csv_path):
+    """Return whether the partitions hold the same observations as the csv, so either can be read"""
+    manifest = read_fetch_manifest(outdir)
+    if manifest is None or 'csv' not in manifest or not partition_years(outdir):
+        return False
+    try:
+        return manifest['csv'] == csv_signature(csv_path)
+    except OSError:
+        return False
+
+
+def clear_partitions(outdir):
+    """Remove all partitions and the fetch manifest, so the next fetch starts from scratch"""
+    if os.path.isdir(partition_dir(outdir)):
+        shutil.rmtree(partition_dir(outdir))
+
+
+def generate_csv_from_mast(csv_name, outdir, datatype, instrument, max_workers=None, resume=True,
+                           **fetch_kwargs):
+    """Generate a csv file of the STIS archive from querying MAST.
+
+    Years are fetched concurrently by up to max_workers threads; any further
+    keyword arguments are passed on to fetch_year. Each year is normalized and
+    written to its own partition as soon as it arrives, and the partitions are
+    then streamed into the archive csv, so only a few years are in memory at once.
+
+    Every finished year is checkpointed in a manifest next to the partitions.
+    Unless resume=False, years already completed by an earlier, interrupted run
+    of the same query are not fetched again; the current year is always refetched.
+    """
+    datatype = _check_datatype(datatype)
+
+    # Query year-by-year to avoid data limits:
+    current_year = datetime.now().year
+    years = list(range(1997, current_year + 1))
+
+    query = {'instrument': instrument, 'datatype': datatype}
+    manifest = read_fetch_manifest(outdir)
+    if not resume or manifest is None or manifest['query'] != query:
+        manifest = {'query': query, 'years': {}}
+    fetch = [year for year in years
+             if manifest['years'].get(str(year), {}).get('status') not in ('done', 'empty')
+             or year == current_year]
+    if len(fetch) < len(years):
+        logger.info('Resuming: %d of %d years already fetched', len(years) - len(fetch), len(years))
+
+    def handle_year(year, result):
+        mast = None if result is None else normalize_mast(result)
+        path = write_partition(mast, outdir, year)
+        manifest['years'][str(year)] = {'status': 'empty' if path is None else 'done',
+                                        'rows': 0 if path is None else len(mast),
+                                        'fetched': datetime.now().isoformat(timespec='seconds')}
+        write_fetch_manifest(manifest, outdir)
+        return path
+
+    def handle_error(year, error):
+        manifest['years'][str(year)] = {'status': 'failed', 'error': str(error),
+                                        'fetched': datetime.now().isoformat(timespec='seconds')}
+        write_fetch_manifest(manifest, outdir)
+
+    fetch_years(fetch, instrument, datatype, max_workers, handle_year=handle_year,
+                handle_error=handle_error, **fetch_kwargs)
+
+    combine_partitions(outdir, outdir+csv_name, years)
+    record_csv(outdir, outdir+csv_name)
+
+
+def refresh_csv_from_mast(csv_name, outdir, datatype, instrument, max_workers=None, **fetch_kwargs):
+    """Update an existing archive csv with only the observations MAST added since it was written.
+
+    MAST is queried from the day of the newest Start Time in the csv onwards; the
+    results are merged with the existing rows, deduplicated on the dataset name
+    and written back atomically. Without an existing csv a full fetch is made.
+    """
+    csv_path = outdir+csv_name
+    if not os.path.exists(csv_path):
+        return generate_csv_from_mast(csv_name, outdir, datatype, instrument, max_workers,
+                                      **fetch_kwargs)
+    datatype = _check_datatype(datatype)
+
+    mast = generate_dataframe_from_csv(csv_path)
+    mast['Start Time'] = pd.to_datetime(mast['Start Time'], format='%Y-%m-%d %H:%M:%S')
+    newest = mast['Start Time'].max()
+    in_step = partitions_match(outdir, csv_path)
+
+    years = list(range(newest.year, datetime.now().year + 1))
+    new_years = fetch_years(years, instrument, datatype, max_workers,
+                            first_start=newest.strftime('%b %d %Y'), **fetch_kwargs)
+    if not new_years:
+        logger.info('No new observations since %s', newest)
+        return
+
+    n_existing = len(mast)
+    mast = pd.concat([mast, normalize_mast(pd.concat(new_years))])
+    mast = mast.drop_duplicates(subset=dataset_column, keep='last')
+    mast = mast.sort_values('Start Time', kind='mergesort')
+    logger.info('Added %d observations since %s', len(mast) - n_existing, newest)
+    write_csv(mast, csv_path)
+
+    # Keep existing partitions of the refreshed years in step with the csv
+    if partition_years(outdir):
+        refreshed = mast[mast['Start Time'].dt.year >= years[0]]
+        for year in years:
+            write_partition(refreshed[refreshed['Start Time'].dt.year == year], outdir, year)
+        if in_step:
+            record_csv(outdir, csv_path)
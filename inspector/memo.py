@@ -0,0 +1,74 @@
+import functools
+import threading
+from collections import OrderedDict
+
+from .archive import get_dataset
+from .config import config
+
+# Hit and miss counters of every memoized figure builder, by function name
+cache_stats = {}
+
+
+def canonical(value):
+    """Turn callback inputs into a hashable key that ignores irrelevant differences.
+
+    Checklist values are sorted, slider values rounded and dicts (such as
+    clickData) sorted by key, so equivalent requests share one cache entry.
+    """
+    if isinstance(value, float):
+        return round(value, 3)
+    if isinstance(value, dict):
+        return tuple(sorted((key, canonical(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        items = tuple(canonical(item) for item in value)
+        if all(isinstance(item, str) for item in items):
+            return tuple(sorted(set(items)))
+        return items
+    return value
+
+
+def memoize_figure(function=None, maxsize=None):
+    """Cache the figures returned by a callback in a bounded LRU cache.
+
+    Keys are the canonicalized inputs plus the archive version, and the cache is
+    emptied whenever a new archive version is published. The wrapper takes one
+    snapshot of the dataset (or the dataset passed in) and hands it to the
+    function as dataset=, so the figure and its cache key come from one version.
+    """
+    if function is None:
+        return functools.partial(memoize_figure, maxsize=maxsize)
+    if maxsize is None:
+        maxsize = config['inspector']['figure_cache_size']
+
+    cache = OrderedDict()
+    cached_version = [None]
+    lock = threading.Lock()
+    stats = cache_stats.setdefault(function.__name__, {'hits': 0, 'misses': 0})
+
+    @functools.wraps(function)
+    def wrapper(*args, dataset=None):
+        if dataset is None:
+            dataset = get_dataset()
+        version = dataset['version']
+        key = canonical(args)
+        with lock:
+            if cached_version[0] is None or version > cached_version[0]:
+                cache.clear()
+                cached_version[0] = version
+            if cached_version[0] == version and key in cache:
+                cache.move_to_end(key)
+                stats['hits'] += 1
+                return cache[key]
+            stats['misses'] += 1
+
+        figure = function(*args, dataset=dataset)
+
+        with lock:
+            if cached_version[0] == version:
+                cache[key] = figure
+                if len(cache) > maxsize:
+                    cache.popitem(last=False)
+        return figure
+
+    wrapper.cache_clear = cache.clear
+    return wrapper
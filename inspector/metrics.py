@@ -0,0 +1,170 @@
+import functools
+import logging
+import threading
+import time
+
+from dash.exceptions import PreventUpdate
+from flask import Response
+
+from .archive import get_dataset, memory_report
+from .config import config
+from .memo import cache_stats
+
+logger = logging.getLogger(__name__)
+
+# Name, type, help text and histogram buckets of every exported metric
+metric_types = {
+    'inspector_callback_duration_seconds': (
+        'histogram', 'Callback latency, including serialization of the response',
+        (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)),
+    'inspector_callback_calls_total': (
+        'counter', 'Callback calls by outcome (ok, prevented or error)', None),
+    'inspector_callback_rows_scanned': (
+        'histogram', 'Archive rows read per callback call (cube lookups read none)',
+        (0, 1e3, 1e4, 1e5, 1e6, 1e7)),
+    'inspector_callback_response_size_chars': (
+        'histogram', 'Length of the JSON response of a callback call',
+        (1e3, 1e4, 1e5, 1e6, 1e7)),
+    'inspector_callback_selection_size': (
+        'histogram', 'Number of values selected in a checklist input of a callback call',
+        (0, 1, 2, 3, 5, 10, 20)),
+    'inspector_figure_cache_hits_total': ('counter', 'Figure cache hits per callback', None),
+    'inspector_figure_cache_misses_total': ('counter', 'Figure cache misses per callback', None),
+    'inspector_archive_version': ('gauge', 'Version of the loaded archive (increases on reload)', None),
+    'inspector_archive_rows': ('gauge', 'Observations in the loaded archive', None),
+    'inspector_archive_column_bytes': ('gauge', 'Memory held by each column of the loaded archive', None),
+    'inspector_process_resident_bytes': ('gauge', 'Resident memory of this process', None),
+}
+
+# Collected values, keyed by metric name and a tuple of (label, value) pairs
+_counters = {}
+_histograms = {}
+_lock = threading.Lock()
+
+# Rows read by the callback running in this thread
+_scan = threading.local()
+
+
+def increment(name, value=1, **labels):
+    """Add to a counter"""
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, value, **labels):
+    """Record one value in a histogram"""
+    key = (name, tuple(sorted(labels.items())))
+    buckets = metric_types[name][2]
+    with _lock:
+        histogram = _histograms.setdefault(key, {'counts': [0]*len(buckets), 'sum': 0, 'count': 0})
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                histogram['counts'][i] += 1
+        histogram['sum'] += value
+        histogram['count'] += 1
+
+
+def count_rows(n_rows):
+    """Record that the current callback read n_rows archive rows"""
+    if getattr(_scan, 'rows', None) is not None:
+        _scan.rows += n_rows
+
+
+def instrument_callback(name, function, input_ids):
+    """Wrap a Dash callback so every call records latency, rows, payload and selection sizes"""
+    slow = config['inspector']['slow_callback_seconds']
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        for input_id, value in zip(input_ids, args):
+            if isinstance(value, list) and all(isinstance(item, str) for item in value):
+                observe('inspector_callback_selection_size', len(value), callback=name, input=input_id)
+
+        _scan.rows = 0
+        status = 'error'
+        start = time.perf_counter()
+        try:
+            response = function(*args, **kwargs)
+            status = 'ok'
+            return response
+        except PreventUpdate:
+            status = 'prevented'
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            rows, _scan.rows = _scan.rows, None
+            increment('inspector_callback_calls_total', callback=name, status=status)
+            if status == 'ok':
+                observe('inspector_callback_duration_seconds', duration, callback=name)
+                observe('inspector_callback_rows_scanned', rows, callback=name)
+                observe('inspector_callback_response_size_chars', len(response), callback=name)
+            log = logger.warning if duration > slow else logger.debug
+            log('callback=%s status=%s duration_ms=%.1f rows=%d response_chars=%s',
+                name, status, 1000*duration, rows, len(response) if status == 'ok' else '-')
+
+    return wrapper
+
+
+def instrument_callbacks(app):
+    """Instrument every server-side callback registered on the app so far"""
+    for callback in app.callback_map.values():
+        function = callback.get('callback')
+        if function is None or hasattr(function, 'instrumented'):
+            continue
+        input_ids = [item['id'] for item in callback.get('inputs', []) + callback.get('state', [])]
+        callback['callback'] = instrument_callback(function.__name__, function, input_ids)
+        callback['callback'].instrumented = True
+
+
+def _format_labels(labels, **extra):
+    labels = dict(labels, **extra)
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels.items()) + '}'
+
+
+def render_metrics():
+    """Return every metric in the Prometheus text exposition format"""
+    dataset = get_dataset()
+    memory = memory_report(dataset)
+    gauges = {('inspector_archive_version', ()): dataset['version'],
+              ('inspector_archive_rows', ()): len(dataset['archive'])}
+    for column, size in memory['columns'].items():
+        gauges[('inspector_archive_column_bytes', (('column', column),))] = size
+    if memory['process_bytes'] is not None:
+        gauges[('inspector_process_resident_bytes', ())] = memory['process_bytes']
+    counters = {}
+    for callback, stats in cache_stats.items():
+        counters[('inspector_figure_cache_hits_total', (('callback', callback),))] = stats['hits']
+        counters[('inspector_figure_cache_misses_total', (('callback', callback),))] = stats['misses']
+    with _lock:
+        counters.update(_counters)
+        histograms = {key: dict(value, counts=list(value['counts'])) for key, value in _histograms.items()}
+
+    lines = []
+    for name, (metric_type, help_text, buckets) in metric_types.items():
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {metric_type}']
+        if metric_type == 'histogram':
+            for (key_name, labels), histogram in sorted(histograms.items()):
+                if key_name != name:
+                    continue
+                labels = dict(labels)
+                for bound, count in zip(buckets, histogram['counts']):
+                    lines.append(f'{name}_bucket{_format_labels(labels, le=bound)} {count}')
+                lines.append(f'{name}_bucket{_format_labels(labels, le="+Inf")} {histogram["count"]}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {histogram["sum"]}')
+                lines.append(f'{name}_count{_format_labels(labels)} {histogram["count"]}')
+        else:
+            values = gauges if metric_type == 'gauge' else counters
+            for (key_name, labels), value in sorted(values.items()):
+                if key_name == name:
+                    lines.append(f'{name}{_format_labels(dict(labels))} {value}')
+
+    return '\n'.join(lines) + '\n'
+
+
+def register_metrics_route(server, path='/metrics'):
+    """Serve the metrics of this process at path on the Flask server"""
+    server.add_url_rule(path, 'inspector_metrics',
+                        lambda: Response(render_metrics(), mimetype='text/plain; version=0.0.4'))
@@ -1,55 +1,48 @@
 import numpy as np
-from dash.dependencies import Input, Output
+from dash.dependencies import ClientsideFunction, Input, Output
 import plotly.graph_objs as go
-from datetime import datetime
 
 from .server import app
 from .config import config
-from .fetch_metadata import generate_dataframe_from_csv, generate_csv_from_mast
-from .utils import dt_to_dec
-
-use_apache = config['inspector']['use_apache']
-if use_apache:
-    mast = generate_dataframe_from_csv(
-        "https://www.stsci.edu/~STIS/stis_archive.csv")
-else:
-    outdir = config['inspector']['outdir']
-    csv_name = config['inspector']['csv_name']
-    mast = generate_dataframe_from_csv(outdir+csv_name)
-
-overview_df = mast[["Start Time", "obstype", "Instrument Config", "Exp Time"]].copy()
-start_times = np.array([datetime.strptime(str(start_time), "%Y-%m-%d %H:%M:%S")
-                        for start_time in overview_df['Start Time']])
-
-overview_df.loc[:,'Decimal Year'] = [dt_to_dec(time) for time in start_times]
-overview_df = overview_df[["Decimal Year",
-                           "obstype", "Instrument Config", "Exp Time"]]
+from .memo import memoize_figure
+from .payload import compact_figure
+from .archive import get_dataset
+from .cube import detector_totals
+from .utils import metric_names
 
 # Overview callbacks
-@app.callback(Output('detector-pie-chart', 'figure'),
-              [Input('detector-date-slider', 'value'),
-              Input('detector-metric-dropdown','value')])
-def update_detector_pie_figure(year_range, overview_metric):
+@app.callback(Output('detector-pie-store', 'data'),
+              [Input('detector-date-slider', 'value')],
+              prevent_initial_call=True)
+@memoize_figure
+def update_detector_pie_figure(year_range, dataset=None):
+    dataset = get_dataset() if dataset is None else dataset
     mode_daterange = year_range
 
     instrument = config['inspector']['instrument']
 
-    # Filter observations by observation year (decimal)
-    filtered_df = overview_df[(overview_df['Decimal Year'] >= year_range[0]) &
-                              (overview_df['Decimal Year'] <= year_range[1])]
-    # Filter modes by group
-    n_tots = []
-    detectors = np.sort(filtered_df['Instrument Config'].unique())
-    for detector in detectors:
+    # Sum the precomputed cube over the observation years (decimal)
+    counts, exptimes = detector_totals(dataset['cubes']['Filters/Gratings'], year_range)
+    detectors = np.array(counts.index)
+
+    # One figure per metric; the metric dropdown picks one in the browser
+    figures = {}
+    for overview_metric in metric_names:
         if overview_metric == "n-obs":
-            n_tots.append(np.sum(filtered_df['Instrument Config'] == detector))
+            n_tots = list(counts)
         else:
-            n_tots.append(np.sum(
-                filtered_df['Exp Time'][filtered_df['Instrument Config'] == detector])/60/60)
+            n_tots = list(exptimes/60/60)
+
+        pie_data = [go.Pie(labels=detectors, values=n_tots, opacity=0.8,sort=False)]
+
+        figures[overview_metric] = compact_figure({
+            'data': pie_data,
+            'layout': go.Layout(title=f"Relative STIS Detector Usage", hovermode='closest')
+        })
+    return figures
 
-    pie_data = [go.Pie(labels=detectors, values=n_tots, opacity=0.8,sort=False)]
 
-    return {
-        'data': pie_data,
-        'layout': go.Layout(title=f"Relative STIS Detector Usage", hovermode='closest')
-    }
+app.clientside_callback(ClientsideFunction(namespace='inspector', function_name='select_metric'),
+                        Output('detector-pie-chart', 'figure'),
+                        [Input('detector-pie-store', 'data'),
+                         Input('detector-metric-dropdown', 'value')])
@@ -0,0 +1,77 @@
+import gzip
+
+import numpy as np
+from flask import request
+
+from .config import config
+
+# Trace properties holding the plotted numbers
+numeric_properties = ('x', 'y', 'values')
+
+
+def round_values(values, digits):
+    """Return an array as a list, with floats rounded to digits significant digits.
+
+    Rounded floats have a short JSON representation (1234.57 rather than
+    1234.5678901234). Integer and string arrays are returned unchanged.
+    """
+    values = np.asarray(values)
+    if values.dtype.kind != 'f':
+        return values.tolist()
+    magnitude = np.floor(np.log10(np.abs(np.where(values == 0, 1, values))))
+    scale = 10.0 ** (digits - 1 - magnitude)
+    return (np.round(values * scale) / scale).tolist()
+
+
+def compact_figure(figure, digits=None):
+    """Return a figure as plain dicts and lists with rounded numbers, for a smaller response.
+
+    Plotly objects are replaced by the JSON they serialize to, which only holds
+    the properties that were set, so the layout stays minimal.
+    """
+    digits = config['inspector']['figure_digits'] if digits is None else digits
+    figure = dict(figure)
+    if figure.get('data') is not None:
+        traces = []
+        for trace in figure['data']:
+            trace = trace.to_plotly_json() if hasattr(trace, 'to_plotly_json') else dict(trace)
+            for prop in numeric_properties:
+                if trace.get(prop) is not None:
+                    trace[prop] = round_values(trace[prop], digits)
+            traces.append(trace)
+        figure['data'] = traces
+    if hasattr(figure.get('layout'), 'to_plotly_json'):
+        figure['layout'] = figure['layout'].to_plotly_json()
+    return figure
+
+
+def compress_responses(server, min_size=None):
+    """Gzip the JSON responses (layout, dependencies and callbacks) of the Flask server.
+
+    Only responses of at least min_size bytes are compressed, for clients that
+    accept gzip.
+
+    Dash 2 only gzips through flask-compress, which is the optional dash[compress]
+    extra and is switched off by default (compress=False). This hook keeps the
+    pinned requirements free of it, and lets compress_min_size leave the many
+    small callback responses uncompressed.
+    """
+    min_size = config['inspector']['compress_min_size'] if min_size is None else min_size
+
+    @server.after_request
+    def gzip_response(response):
+        if (response.status_code != 200 or response.direct_passthrough
+                or response.mimetype != 'application/json'
+                or 'Content-Encoding' in response.headers
+                or 'gzip' not in request.headers.get('Accept-Encoding', '')):
+            return response
+        data = response.get_data()
+        if len(data) < min_size:
+            return response
+        response.set_data(gzip.compress(data, compresslevel=6))
+        response.headers['Content-Encoding'] = 'gzip'
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
+
+    return gzip_response
+
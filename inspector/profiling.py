@@ -0,0 +1,96 @@
+import contextlib
+import cProfile
+import functools
+import itertools
+import logging
+import os
+import random
+import threading
+import time
+
+from .config import config
+
+logger = logging.getLogger(__name__)
+
+# Only one profiler can run at a time, so concurrent calls are not sampled
+_profile_lock = threading.Lock()
+_sequence = itertools.count()
+
+
+def profiling_enabled():
+    """Return whether profiling is switched on by INSPECTOR_PROFILE or the 'profile' config option"""
+    setting = os.environ.get('INSPECTOR_PROFILE')
+    if setting is not None:
+        return setting.lower() not in ('', '0', 'false', 'no')
+    return bool(config['inspector']['profile'])
+
+
+def sample_rate():
+    """Return the fraction of callback calls to profile"""
+    return float(os.environ.get('INSPECTOR_PROFILE_SAMPLE', config['inspector']['profile_sample_rate']))
+
+
+def profile_dir():
+    """Return the directory the .prof files are written to"""
+    return os.path.join(config['inspector']['outdir'], config['inspector']['profile_dir'])
+
+
+def _dump(profiler, name):
+    """Write a profile as <profile_dir>/<name>-<time>-<pid>-<n>.prof, returning the path"""
+    os.makedirs(profile_dir(), exist_ok=True)
+    path = os.path.join(profile_dir(), '{}-{}-{}-{}.prof'.format(
+        name, time.strftime('%Y%m%dT%H%M%S'), os.getpid(), next(_sequence)))
+    profiler.dump_stats(path)
+    return path
+
+
+@contextlib.contextmanager
+def profile_startup(name='startup'):
+    """Profile the enclosed startup steps when profiling is enabled"""
+    if not profiling_enabled():
+        yield
+        return
+    profiler = cProfile.Profile()
+    with _profile_lock:
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            logger.info('Wrote startup profile %s', _dump(profiler, name))
+
+
+def profile_callback(name, function, rate):
+    """Wrap a Dash callback so a fraction rate of its calls are profiled"""
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if random.random() >= rate or not _profile_lock.acquire(blocking=False):
+            return function(*args, **kwargs)
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                profiler.disable()
+                _dump(profiler, name)
+        finally:
+            _profile_lock.release()
+
+    return wrapper
+
+
+def profile_callbacks(app):
+    """Profile the server-side callbacks of the app, if profiling is enabled.
+
+    When it is disabled the callbacks are left untouched, so there is no overhead.
+    """
+    if not profiling_enabled():
+        return
+    rate = sample_rate()
+    for callback in app.callback_map.values():
+        function = callback.get('callback')
+        if function is not None:
+            callback['callback'] = profile_callback(function.__name__, function, rate)
+    logger.info('Profiling %.0f%% of callback calls into %s', 100*rate, profile_dir())
@@ -1,6 +1,10 @@
+import os
+
 from dash import Dash
 from .config import config
 
 stylesheets=config['inspector']['stylesheets']
-app = Dash(external_stylesheets=stylesheets, suppress_callback_exceptions=True)
-
+# Served scripts (the clientside callbacks) live in inspector/assets. Responses
+# are gzipped by inspector.payload.compress_responses, not flask-compress
+app = Dash(external_stylesheets=stylesheets, suppress_callback_exceptions=True, compress=False,
+           assets_folder=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets'))
@@ -0,0 +1,173 @@
+"""Write a synthetic STIS archive csv for scale testing without access to MAST.
+
+    python -m inspector.synthetic --rows 2000000 --seed 1 --output /tmp/stis_archive.csv
+
+The csv holds the columns the inspector reads (dataset name, start time, exposure
+time, detector, operating mode, aperture, grating and central wavelength, plus
+the columns normalize_mast derives from them), not the full MAST schema written
+by generate_csv_from_mast. Modes and apertures are drawn from the vocabularies
+in inspector/config.py.
+"""
+import argparse
+import datetime
+import os
+
+import numpy as np
+import pandas as pd
+
+from .config import config
+from .fetch_metadata import normalize_mast
+
+# Detector and a few supported central wavelengths (Angstroms) of every mode
+mode_settings = {
+    "G140L": ("STIS/FUV-MAMA", [1425]),
+    "G140M": ("STIS/FUV-MAMA", [1173, 1218, 1222, 1272, 1321, 1371, 1420, 1470, 1518, 1567, 1616, 1665, 1714]),
+    "G230L": ("STIS/NUV-MAMA", [2376]),
+    "G230M": ("STIS/NUV-MAMA", [1687, 1769, 1851, 1933, 2014, 2095, 2176, 2257, 2338, 2419, 2499, 2579,
+                                2659, 2739, 2818, 2898, 2977, 3055]),
+    "G230LB": ("STIS/CCD", [2375]),
+    "G230MB": ("STIS/CCD", [1713, 1854, 1995, 2135, 2276, 2416, 2557, 2697, 2836, 2976, 3115]),
+    "G430L": ("STIS/CCD", [4300]),
+    "G430M": ("STIS/CCD", [3165, 3305, 3423, 3680, 3843, 3936, 4194, 4451, 4706, 4781, 4961, 5093, 5216, 5471]),
+    "G750L": ("STIS/CCD", [7751]),
+    "G750M": ("STIS/CCD", [5734, 6094, 6252, 6581, 6768, 7283, 7795, 8311, 8561, 8825, 9286, 9336, 9806, 9851,
+                           10363]),
+    "E140M": ("STIS/FUV-MAMA", [1425]),
+    "E140H": ("STIS/FUV-MAMA", [1234, 1271, 1307, 1343, 1380, 1416, 1453, 1489, 1526, 1562, 1598]),
+    "E230M": ("STIS/NUV-MAMA", [1978, 2124, 2269, 2415, 2561, 2707]),
+    "E230H": ("STIS/NUV-MAMA", [1763, 1813, 1863, 1913, 1963, 2013, 2063, 2113, 2163, 2213, 2263, 2313, 2363,
+                                2413, 2463, 2513, 2563, 2613, 2663, 2713, 2762, 2812, 2862, 2912, 2962, 3012]),
+    "PRISM": ("STIS/NUV-MAMA", [1200, 2125]),
+    "MIRVIS": ("STIS/CCD", [5735]),
+    "MIRNUV": ("STIS/NUV-MAMA", [2269]),
+    "MIRFUV": ("STIS/FUV-MAMA", [1370]),
+}
+
+# Aperture groups (config['apertures']['labels']) used for spectroscopy; the rest are for imaging
+spectroscopic_aperture_labels = ["Long Slits", "Neutral-Density-Filtered Long Slits", "Square Apertures"]
+
+# Observations span Servicing Mission 2 to last_observation (fixed, so a seed always
+# gives the same archive), except the 2004-2009 Side-2 failure
+first_observation = datetime.datetime(1997, 2, 20)
+last_observation = datetime.datetime(2020, 10, 1)
+suspension = (datetime.datetime(2004, 8, 3), datetime.datetime(2009, 5, 24))
+
+# Fraction of CCD imaging observations taken with the coronagraphic aperture
+coronagraphic_fraction = 0.05
+
+
+def _popularity(rng, n):
+    """Return random, Zipf-like selection probabilities for n choices"""
+    weights = 1 / np.arange(1, n + 1)
+    rng.shuffle(weights)
+    return weights / weights.sum()
+
+
+def _vocabularies(rng):
+    """Return the modes, apertures and their selection probabilities for one archive"""
+    modes = [mode for group in config['modes']['spec_groups'] + config['modes']['im_groups']
+             for mode in group if mode in mode_settings]
+
+    spec_apertures, im_apertures = [], []
+    for label, group in zip(config['apertures']['labels'], config['apertures']['groups']):
+        if label in spectroscopic_aperture_labels:
+            spec_apertures += group
+        else:
+            im_apertures += [aperture for aperture in group if aperture != '50CORON']
+
+    return {'modes': (modes, _popularity(rng, len(modes))),
+            'spec_apertures': (spec_apertures, _popularity(rng, len(spec_apertures))),
+            'im_apertures': (im_apertures, _popularity(rng, len(im_apertures)))}
+
+
+def _start_times(rng, n_rows, end):
+    """Draw observation start times, skipping the STIS suspension"""
+    start = np.datetime64(first_observation, 's').astype(np.int64)
+    stop = np.datetime64(end, 's').astype(np.int64)
+    if stop <= start:
+        raise ValueError('end {} is before the first observation {}'.format(end, first_observation))
+    # Only the part of the suspension between start and stop is skipped
+    gap_start, gap_end = (np.clip(np.datetime64(date, 's').astype(np.int64), start, stop)
+                          for date in suspension)
+
+    seconds = rng.integers(start, stop - (gap_end - gap_start), n_rows)
+    seconds = np.where(seconds >= gap_start, seconds + (gap_end - gap_start), seconds)
+    return seconds.astype('datetime64[s]')
+
+
+def generate_archive(n_rows, seed=0, end=None, first_index=0, vocabularies=None, rng=None):
+    """Return a synthetic archive of n_rows observations, with the columns the inspector reads.
+
+    end is the latest possible start time (last_observation by default). first_index numbers
+    the rows and dataset names, so chunks of one archive can be generated apart.
+    """
+    rng = np.random.default_rng(seed) if rng is None else rng
+    vocabularies = _vocabularies(rng) if vocabularies is None else vocabularies
+    end = last_observation if end is None else end
+
+    modes, mode_weights = vocabularies['modes']
+    mode_codes = rng.choice(len(modes), n_rows, p=mode_weights)
+    mode_names = np.array(modes, dtype=object)[mode_codes]
+    detectors = np.array([mode_settings[mode][0] for mode in modes], dtype=object)[mode_codes]
+
+    cenwaves = np.empty(n_rows)
+    for code, mode in enumerate(modes):
+        rows = mode_codes == code
+        cenwaves[rows] = rng.choice(mode_settings[mode][1], rows.sum())
+
+    imaging = np.array([mode.startswith('MIR') for mode in modes])[mode_codes]
+    apertures = np.empty(n_rows, dtype=object)
+    for rows, key in [(~imaging, 'spec_apertures'), (imaging, 'im_apertures')]:
+        names, weights = vocabularies[key]
+        apertures[rows] = np.array(names, dtype=object)[rng.choice(len(names), rows.sum(), p=weights)]
+    coronagraphic = imaging & (detectors == 'STIS/CCD') & (rng.random(n_rows) < coronagraphic_fraction)
+    apertures[coronagraphic] = '50CORON'
+
+    mama = detectors != 'STIS/CCD'
+    operating_modes = np.where(mama & (rng.random(n_rows) < 0.4), 'TIME-TAG', 'ACCUM')
+    # Exposure times are roughly log-normal, from fractions of a second to hours
+    exptimes = np.clip(np.round(rng.lognormal(np.log(600), 1.2, n_rows), 1), 0.1, 30000)
+
+    index = np.arange(first_index, first_index + n_rows)
+    mast = pd.DataFrame({'Dataset': ['o{:0>8}'.format(np.base_repr(i, 36).lower()) for i in index],
+                         'Start Time': _start_times(rng, n_rows, end),
+                         'Exp Time': exptimes,
+                         'Instrument Config': detectors,
+                         'Operating Mode': operating_modes,
+                         'Apertures': apertures,
+                         'Filters/Gratings': mode_names,
+                         'Central Wavelength': cenwaves},
+                        index=index)
+    return normalize_mast(mast)
+
+
+def write_synthetic_csv(csv_path, n_rows, seed=0, end=None, chunk_size=1000000):
+    """Write a synthetic archive csv of n_rows observations, chunk_size rows at a time"""
+    rng = np.random.default_rng(seed)
+    vocabularies = _vocabularies(rng)
+    end = last_observation if end is None else end
+
+    tmp_path = csv_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        for first_index in range(0, n_rows, chunk_size):
+            chunk = generate_archive(min(chunk_size, n_rows - first_index), end=end,
+                                     first_index=first_index, vocabularies=vocabularies, rng=rng)
+            chunk.to_csv(f, header=first_index == 0)
+    os.replace(tmp_path, csv_path)
+    return csv_path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write a synthetic STIS archive csv')
+    parser.add_argument('--rows', type=int, default=100000, help='number of observations')
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    parser.add_argument('--end', type=int, help='year of the last observations (default {})'.format(
+        last_observation.year))
+    parser.add_argument('--output', default=os.path.join(config['inspector']['outdir'],
+                                                         config['inspector']['csv_name']),
+                        help='path of the csv to write')
+    args = parser.parse_args()
+
+    end = None if args.end is None else datetime.datetime(args.end + 1, 1, 1)
+    write_synthetic_csv(args.output, args.rows, args.seed, end)
+    print(f'Wrote {args.rows} synthetic observations to {args.output}')
@@ -1,11 +1,54 @@
 import numpy as np
-from datetime import datetime
 
 from .server import app
 
+# Values of the metric dropdowns; figure callbacks return a figure for each
+metric_names = ["n-obs", "exptime"]
+
+
+def dec_year(times):
+    """Convert an array of datetimes to decimal years.
+
+    Works on whole columns at once with datetime64 arithmetic and matches
+    the float result of the original per-datetime calculation exactly.
+    """
+    times = np.asarray(times, dtype='datetime64[us]')
+    years = times.astype('datetime64[Y]')
+    year_start = years.astype('datetime64[us]')
+    year_end = (years + 1).astype('datetime64[us]')
+    seconds_so_far = (times - year_start).astype(np.int64) / 1e6
+    seconds_in_year = (year_end - year_start).astype(np.int64) / 1e6
+    return (years.astype(np.int64) + 1970) + seconds_so_far / seconds_in_year
+
+
 def dt_to_dec(dt):
     """Convert a datetime to decimal year."""
-    year_start = datetime(dt.year, 1, 1)
-    year_end = year_start.replace(year=dt.year + 1)
-    return dt.year + ((dt - year_start).total_seconds() /  # seconds so far
-                      float((year_end - year_start).total_seconds()))  # seconds in year
+    return float(dec_year([dt])[0])
+
+
+def group_totals(totals, groups):
+    """Split per-label totals into the configured groups, dropping empty bars.
+
+    Returns the non-zero labels and their totals for each group, in the order
+    the groups and labels are listed in the config.
+    """
+    filtered_groups = []
+    n_tots = []
+    for grp in groups:
+        grp_tots = totals.reindex(grp, fill_value=0).values
+        filtered_groups.append(list(np.array(grp)[grp_tots != 0.0]))
+        n_tots.append(grp_tots[grp_tots != 0.0])
+    return filtered_groups, n_tots
+
+
+def timeline(decimal_years, bins, weights=None):
+    """Count (or sum weights of) observations in each half-open bin [bins[i], bins[i+1]).
+
+    All bins are filled in one pass; observations outside the bins are ignored.
+    """
+    decimal_years = np.asarray(decimal_years, dtype=float)
+    bin_index = np.searchsorted(bins, decimal_years, side='right') - 1
+    in_bins = (bin_index >= 0) & (bin_index < len(bins) - 1)
+    if weights is not None:
+        weights = np.nan_to_num(np.asarray(weights, dtype=float)[in_bins])
+    return np.bincount(bin_index[in_bins], weights=weights, minlength=len(bins) - 1)
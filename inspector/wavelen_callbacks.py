@@ -1,93 +1,101 @@
 import numpy as np
-from dash.dependencies import Input, Output, State
+from dash.dependencies import ClientsideFunction, Input, Output
 import plotly.graph_objs as go
-from datetime import datetime
 
 from .server import app
 from .config import config
-from .fetch_metadata import generate_dataframe_from_csv, generate_csv_from_mast
-from .utils import dt_to_dec
-
-use_apache = config['inspector']['use_apache']
-if use_apache:
-    mast = generate_dataframe_from_csv(
-        "https://www.stsci.edu/~STIS/stis_archive.csv")
-else:
-    outdir = config['inspector']['outdir']
-    csv_name = config['inspector']['csv_name']
-    mast = generate_dataframe_from_csv(outdir+csv_name)
+from .memo import memoize_figure
+from .metrics import count_rows
+from .payload import compact_figure
+from .archive import get_dataset, year_slice, category_mask
+from .utils import metric_names, timeline
 
 instrument = config['inspector']['instrument']
 
-wav_df = mast[["Central Wavelength","Start Time", "obstype", "Instrument Config", "Exp Time", "Filters/Gratings"]].copy()
-start_times = np.array([datetime.strptime(str(start_time), "%Y-%m-%d %H:%M:%S")
-                        for start_time in wav_df['Start Time']])
-
-wav_df.loc[:,'Decimal Year'] = [dt_to_dec(time) for time in start_times]
-wav_df = wav_df[["Central Wavelength","Decimal Year",
-                 "obstype", "Instrument Config", "Exp Time", "Filters/Gratings"]]
-
-# Wavelength Callbacks
-@app.callback(Output('wavelength-histogram', 'figure'),
-              [Input('wavelength-date-slider', 'value'),
-               Input('wavelength-type-checklist', 'value'),
-               Input('wavelength-detector-checklist', 'value'),
-               Input('wavelength-metric-dropdown', 'value')])
-def update_wavelength_figure(year_range, wav_obstype, wav_detectors, wav_metric):
-    wav_daterange = year_range
 
+def filter_observations(archive, year_range, wav_obstype, wav_detectors):
+    """Return the observations of the archive in a year range with the selected obstypes and detectors"""
+    # Slice observations by observation year (decimal)
+    wav_df = year_slice(archive, year_range)
+    count_rows(len(wav_df))
     # Filter observations by obstype
     filtered_df = wav_df[(
-        wav_df['obstype'].isin(wav_obstype))]
+        category_mask(wav_df['obstype'], wav_obstype))]
     # Filter observations by detector
     filtered_df = filtered_df[(
-        filtered_df['Instrument Config'].isin(wav_detectors))]
-    # Filter observations by observation year (decimal)
-    filtered_df = filtered_df[(filtered_df['Decimal Year'] >= year_range[0]) & (
-        filtered_df['Decimal Year'] <= year_range[1])]
+        category_mask(filtered_df['Instrument Config'], wav_detectors))]
+    return filtered_df
 
+
+def histogram_bins(filtered_df, wav_detectors):
+    """Return the central wavelength histogram bin edges of the filtered observations"""
     min_wav = min(filtered_df['Central Wavelength'])
     max_wav = max(filtered_df['Central Wavelength'])
     binsize = (max_wav - min_wav)/(15*np.sqrt(len(wav_detectors)))
+    return np.arange(min_wav, max_wav, binsize)
+
+
+@memoize_figure
+def wavelength_bins(year_range, wav_obstype, wav_detectors, dataset=None):
+    """Return the bin edges of the wavelength histogram drawn for a selection.
+
+    Cached, so clicks on the histogram do not filter the archive again.
+    """
+    dataset = get_dataset() if dataset is None else dataset
+    return histogram_bins(filter_observations(dataset['archive'], year_range, wav_obstype, wav_detectors),
+                          wav_detectors)
+
 
-    wav_data = []
+# Wavelength Callbacks
+@app.callback(Output('wavelength-histogram-store', 'data'),
+              [Input('wavelength-date-slider', 'value'),
+               Input('wavelength-type-checklist', 'value'),
+               Input('wavelength-detector-checklist', 'value')],
+               prevent_initial_call=True)
+@memoize_figure
+def update_wavelength_figure(year_range, wav_obstype, wav_detectors, dataset=None):
+    dataset = get_dataset() if dataset is None else dataset
+    wav_daterange = year_range
+
+    filtered_df = filter_observations(dataset['archive'], year_range, wav_obstype, wav_detectors)
+    histbins = histogram_bins(filtered_df, wav_detectors)
+
+    # One figure per metric, from the same filtered rows; the metric dropdown picks one in the browser
+    wav_data = {wav_metric: [] for wav_metric in metric_names}
     for detector in wav_detectors:
-        detector_df = filtered_df[filtered_df['Instrument Config'] == detector]
-        
-        if wav_metric == 'n-obs':
-            histbins = np.arange(
-                min_wav, max_wav, binsize)
-            counts, bin_edges = np.histogram(detector_df['Central Wavelength'], bins=histbins)
-
-            wav_data.append(go.Bar(x=bin_edges, y = counts, opacity=0.7, name=detector))
-
-        else: # mode metric is 'exptime'
-            histbins = np.arange(
-                min_wav, max_wav, binsize)
-            counts, bin_edges = np.histogram(
-                detector_df['Central Wavelength'], bins=histbins, weights=detector_df['Exp Time']/60./60.)
-
-            wav_data.append(go.Bar(x=bin_edges, y=counts,
-                                   opacity=0.7, name=detector))
-            
-            #wav_data[0].data = wav_data[0].data/60/60 # convert to hours
-
-    if wav_metric == "n-obs":
-        ylabel = "Counts"
-    else:
-        ylabel = "Total Exposure Time (Hours)"
-    
-    return {
-        'data': wav_data,
-        'bindata':{'start': min_wav, 
-                   'end': max_wav,
-                   'size': binsize},
-        'layout': go.Layout(title=f"{instrument} Central Wavelength Usage", hovermode='closest',
-                            xaxis={'title': "Wavelength (Angstroms)"},
-                            yaxis={'title': ylabel},
-                            bargap=0.1,
-                            barmode='stack')
-    }
+        detector_df = filtered_df[category_mask(filtered_df['Instrument Config'], [detector])]
+
+        counts, bin_edges = np.histogram(detector_df['Central Wavelength'], bins=histbins)
+        wav_data['n-obs'].append(go.Bar(x=bin_edges, y = counts, opacity=0.7, name=detector))
+
+        # exposure time, in hours
+        counts, bin_edges = np.histogram(
+            detector_df['Central Wavelength'], bins=histbins, weights=detector_df['Exp Time']/60./60.)
+        wav_data['exptime'].append(go.Bar(x=bin_edges, y=counts,
+                                          opacity=0.7, name=detector))
+
+    figures = {}
+    for wav_metric in metric_names:
+        if wav_metric == "n-obs":
+            ylabel = "Counts"
+        else:
+            ylabel = "Total Exposure Time (Hours)"
+
+        figures[wav_metric] = compact_figure({
+            'data': wav_data[wav_metric],
+            'layout': go.Layout(title=f"{instrument} Central Wavelength Usage", hovermode='closest',
+                                xaxis={'title': "Wavelength (Angstroms)"},
+                                yaxis={'title': ylabel},
+                                bargap=0.1,
+                                barmode='stack')
+        })
+    return figures
+
+
+app.clientside_callback(ClientsideFunction(namespace='inspector', function_name='select_metric'),
+                        Output('wavelength-histogram', 'figure'),
+                        [Input('wavelength-histogram-store', 'data'),
+                         Input('wavelength-metric-dropdown', 'value')])
 
 @app.callback(Output('wavelength-bin-timeline', 'figure'),
               [Input('wavelength-date-slider', 'value'),
@@ -95,9 +103,11 @@ def update_wavelength_figure(year_range, wav_obstype, wav_detectors, wav_metric)
                Input('wavelength-histogram', 'clickData'),
                Input("wavelength-type-checklist", 'value'),
                Input('wavelength-detector-checklist', 'value')],
-               [State("wavelength-histogram", "figure")])
+               prevent_initial_call=True)
 def update_wav_bin_timeline_figure(year_range, wav_metric, click_data,
-wav_obstype, wav_detectors, figure):
+wav_obstype, wav_detectors, dataset=None):
+    # One snapshot for the bins and the observations, so a reload in between cannot mix versions
+    dataset = get_dataset() if dataset is None else dataset
     if click_data is not None:
         bincen = click_data['points'][0]['x']
     else:
@@ -106,26 +116,26 @@ wav_obstype, wav_detectors, figure):
             'layout': go.Layout(title=f"Click on a wavelength bin from the left plot", hovermode='closest')
         }
 
-    bins = np.arange(figure['bindata']['start'],
-                    figure['bindata']['end'],
-                    figure['bindata']['size'])
+    bins = wavelength_bins(year_range, wav_obstype, wav_detectors, dataset=dataset)
 
     timeline_bins = np.arange(year_range[0], year_range[1]+2, 1)
 
-    bin_lower = bins[max(np.where(bins <= bincen)[0])]
-    bin_upper = bins[min(np.where(bins > bincen)[0])]
+    # Bars are drawn at their lower bin edge, which the browser gets rounded to figure_digits
+    tolerance = abs(bincen) * 10.0**(1 - config['inspector']['figure_digits'])
+    bin_lower = bins[max(np.where(bins <= bincen + tolerance)[0])]
+    bin_upper = bins[min(np.where(bins > bin_lower)[0])]
 
     wav_daterange = year_range
 
+    # Slice observations by observation year (decimal)
+    wav_df = year_slice(dataset['archive'], [timeline_bins[0], timeline_bins[-1]])
+    count_rows(len(wav_df))
     # Filter observations by obstype
     filtered_df = wav_df[(
-        wav_df['obstype'].isin(wav_obstype))]
+        category_mask(wav_df['obstype'], wav_obstype))]
     # Filter observations by detector
     filtered_df = filtered_df[(
-        filtered_df['Instrument Config'].isin(wav_detectors))]
-    # Filter observations by observation year (decimal)
-    filtered_df = filtered_df[(filtered_df['Decimal Year'] >= year_range[0]) & (
-        filtered_df['Decimal Year'] <= year_range[1]+2)]
+        category_mask(filtered_df['Instrument Config'], wav_detectors))]
     # Filter observations by selected bin
     bin_df = filtered_df[(filtered_df['Central Wavelength'] >= bin_lower) & (
         filtered_df['Central Wavelength'] <= bin_upper)]
@@ -145,34 +155,29 @@ wav_obstype, wav_detectors, figure):
         #For each unique cenwave, search bin df for all observations and create a year on year line plot
         setting_df = bin_df[(bin_df['Filters/Gratings'] == row['Filters/Gratings']) & (bin_df['Central Wavelength'] == row['Central Wavelength'])]
         
-        n_tots = []
-        for i, time_bin in enumerate(timeline_bins):
-            if time_bin == timeline_bins[-1]:
-                continue
-            mask = (np.array(setting_df['Decimal Year']) >= timeline_bins[i]) * \
-                   (np.array(setting_df['Decimal Year']) <= timeline_bins[i + 1])
-            if wav_metric == "n-obs":
-                n_tots.append(len(setting_df[mask]))
-                ylabel = "Number of Observations"
-            else:
-                n_tots.append(np.sum(setting_df['Exp Time'][mask])/60/60)
-                ylabel = "Total Exposure Time (Hours)"
-
-        timeline_data.append(go.Scatter(x=timeline_bins, y=n_tots,
+        if wav_metric == "n-obs":
+            n_tots = timeline(setting_df['Decimal Year'], timeline_bins)
+            ylabel = "Number of Observations"
+        else:
+            n_tots = timeline(setting_df['Decimal Year'], timeline_bins,
+                              weights=setting_df['Exp Time'])/60/60
+            ylabel = "Total Exposure Time (Hours)"
+
+        timeline_data.append(go.Scatter(x=timeline_bins[:-1], y=n_tots,
                                   mode='lines+markers',
                                   name=f'{inst},{det},{mode},{cenwave}',
                                   fill='tozeroy',
                                   opacity=0.6))
 
     
-    return {
+    return compact_figure({
         'data': timeline_data,
         'layout': go.Layout(title=f"Cenwave Setting Usage in Bin", hovermode='closest',
                             xaxis={'title': "Year"},
                             yaxis={'title': ylabel,
                                    'type':'log'},
                             showlegend=True)
-    }
+    })
 
 
 
@@ -0,0 +1,314 @@
+"""Load test the STIS Archive Inspector with concurrent simulated users on localhost.
+
+    python loadtest.py --users 20 --duration 60 --rows 1000000
+
+Starts the inspector on a synthetic archive (or the csv given with --csv) in a
+separate process, or targets a server that is already running with --url (for
+example gunicorn serving wsgi:server, to compare serving modes). Each simulated
+user loads the page and then, with a pause between actions, drags date
+sliders, toggles checklists, switches metrics and clicks bars, sending the
+/_dash-update-component requests a browser would send for every callback the
+change triggers. Clicks on a bar send the clicked point, as the browser does.
+Clientside callbacks (the metric switch of the figures) are emulated without a
+request. Switching tabs triggers no callbacks in this app, so it only changes
+which controls a user acts on next.
+
+Throughput and p50/p95/p99 latencies per callback are printed, and written as
+JSON with --output.
+"""
+import argparse
+import gzip
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib import error, request
+
+import numpy as np
+
+# Relative frequency of each kind of user action
+action_weights = {'drag': 4, 'toggle': 2, 'metric': 1, 'click': 3}
+
+
+def http(url, body=None, timeout=60):
+    """Send a GET (or, with a body, a JSON POST) and return the status and decoded JSON"""
+    data = None if body is None else json.dumps(body).encode()
+    headers = {'Accept-Encoding': 'gzip'}
+    if body is not None:
+        headers['Content-Type'] = 'application/json'
+    try:
+        with request.urlopen(request.Request(url, data=data, headers=headers), timeout=timeout) as response:
+            content = response.read()
+            if response.headers.get('Content-Encoding') == 'gzip':
+                content = gzip.decompress(content)
+            return response.status, json.loads(content) if content else None
+    except error.HTTPError as e:
+        return e.code, None
+
+
+def walk_layout(node, tab=None, components=None):
+    """Collect the components with an id from a Dash layout, by tab label"""
+    components = {} if components is None else components
+    if isinstance(node, list):
+        for child in node:
+            walk_layout(child, tab, components)
+    elif isinstance(node, dict) and 'props' in node:
+        props = node['props']
+        if node.get('type') == 'Tab':
+            tab = props.get('label')
+        if 'id' in props:
+            components[props['id']] = {'type': node['type'], 'tab': tab, 'props': props}
+        walk_layout(props.get('children'), tab, components)
+    return components
+
+
+class User(threading.Thread):
+    """A simulated analyst acting on the page until the deadline"""
+
+    def __init__(self, url, deadline, think, seed, record):
+        super().__init__(daemon=True)
+        self.url, self.deadline, self.think = url, deadline, think
+        self.random = random.Random(seed)
+        self.record = record
+
+    def timed(self, name, url, body=None):
+        start = time.perf_counter()
+        try:
+            status, content = http(url, body)
+        except OSError:
+            status, content = None, None
+        self.record(name, time.perf_counter() - start, status in (200, 204))
+        return status, content
+
+    def load_page(self):
+        _, layout = self.timed('page-layout', self.url + '/_dash-layout')
+        _, dependencies = self.timed('page-dependencies', self.url + '/_dash-dependencies')
+        self.components = walk_layout(layout)
+        self.state = {}
+        for component_id, component in self.components.items():
+            for prop in ('value', 'figure', 'clickData', 'data'):
+                self.state[(component_id, prop)] = component['props'].get(prop)
+
+        self.callbacks = {}
+        for dependency in dependencies or []:
+            for item in dependency['inputs']:
+                self.callbacks.setdefault((item['id'], item['property']), []).append(dependency)
+        # Clientside callbacks run on page load in the browser
+        for dependency in dependencies or []:
+            if dependency.get('clientside_function'):
+                self.run_callback(dependency, None)
+
+    def run_callback(self, dependency, changed):
+        """Run one callback as the browser would, then everything its output triggers"""
+        output_id, output_prop = dependency['output'].split('.')
+        inputs = [dict(item, value=self.state.get((item['id'], item['property'])))
+                  for item in dependency['inputs']]
+        if dependency.get('clientside_function'):
+            # The only clientside function, select_metric, picks one metric's figure from a store
+            figures, metric = inputs[0]['value'], inputs[1]['value']
+            value = (figures or {}).get(metric)
+            if value is None:
+                return
+        else:
+            body = {'output': dependency['output'],
+                    'outputs': {'id': output_id, 'property': output_prop},
+                    'inputs': inputs,
+                    'state': [dict(item, value=self.state.get((item['id'], item['property'])))
+                              for item in dependency['state']],
+                    'changedPropIds': [changed]}
+            status, content = self.timed(output_id, self.url + '/_dash-update-component', body)
+            if status != 200 or not content:
+                return
+            value = content['response'][output_id][output_prop]
+        self.change(output_id, output_prop, value)
+
+    def change(self, component_id, prop, value):
+        """Set a property as the browser would and run every callback it triggers"""
+        self.state[(component_id, prop)] = value
+        for dependency in self.callbacks.get((component_id, prop), []):
+            self.run_callback(dependency, f'{component_id}.{prop}')
+
+    def act(self, tab):
+        """Perform one random action on the controls of a tab"""
+        controls = {kind: [component_id for component_id, component in self.components.items()
+                           if component['tab'] == tab and component['type'] == kind]
+                    for kind in ('RangeSlider', 'Checklist', 'Dropdown', 'Graph')}
+        action = self.random.choices(list(action_weights), list(action_weights.values()))[0]
+
+        if action == 'drag' and controls['RangeSlider']:
+            # Drag one handle a few years, sending a request at every step
+            slider = self.random.choice(controls['RangeSlider'])
+            props = self.components[slider]['props']
+            low, high = self.state[(slider, 'value')]
+            handle = self.random.randrange(2)
+            for _ in range(self.random.randint(2, 6)):
+                if handle == 0:
+                    low = min(max(props['min'], low + self.random.choice([-1, 1])), high - 1)
+                else:
+                    high = max(min(props['max'], high + self.random.choice([-1, 1])), low + 1)
+                self.change(slider, 'value', [low, high])
+        elif action == 'toggle' and controls['Checklist']:
+            checklist = self.random.choice(controls['Checklist'])
+            options = [option['value'] for option in self.components[checklist]['props']['options']]
+            value = list(self.state[(checklist, 'value')] or [])
+            option = self.random.choice(options)
+            if option in value and len(value) > 1:
+                value.remove(option)
+            elif option not in value:
+                value.append(option)
+            self.change(checklist, 'value', value)
+        elif action == 'metric' and controls['Dropdown']:
+            dropdown = self.random.choice(controls['Dropdown'])
+            options = [option['value'] for option in self.components[dropdown]['props']['options']]
+            current = self.state[(dropdown, 'value')]
+            self.change(dropdown, 'value', self.random.choice([o for o in options if o != current] or options))
+        elif action == 'click':
+            # Click a bar of a graph whose clickData drives another callback
+            graphs = [graph for graph in controls['Graph'] if (graph, 'clickData') in self.callbacks]
+            points = []
+            if graphs:
+                graph = self.random.choice(graphs)
+                figure = self.state.get((graph, 'figure')) or {}
+                for trace in figure.get('data') or []:
+                    points += [x for x, y in zip(trace.get('x') or [], trace.get('y') or []) if y]
+            if points:
+                self.change(graph, 'clickData', {'points': [{'x': self.random.choice(points)}]})
+
+    def run(self):
+        while time.time() < self.deadline:
+            self.load_page()
+            tabs = sorted({component['tab'] for component in self.components.values()
+                           if component['tab'] is not None})
+            for _ in range(self.random.randint(5, 20)):
+                if time.time() >= self.deadline or not tabs:
+                    break
+                self.act(self.random.choice(tabs))
+                time.sleep(self.random.expovariate(1 / self.think) if self.think else 0)
+
+
+def run_load(url, users, duration, think, seed):
+    """Run the simulated users against url and return the latencies of every request"""
+    latencies, failures = {}, {}
+    lock = threading.Lock()
+
+    def record(name, seconds, ok):
+        with lock:
+            if ok:
+                latencies.setdefault(name, []).append(seconds)
+            else:
+                failures[name] = failures.get(name, 0) + 1
+
+    deadline = time.time() + duration
+    threads = [User(url, deadline, think, seed + i, record) for i in range(users)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, failures, time.time() - start
+
+
+def summarize(latencies, failures, elapsed):
+    """Return throughput and latency percentiles (ms) per callback"""
+    names = sorted(set(latencies) | set(failures))
+    summary = {}
+    for name in names + ['all']:
+        if name == 'all':
+            values = np.concatenate([values for values in latencies.values()] or [[]])
+            n_failed = sum(failures.values())
+        else:
+            values = np.array(latencies.get(name, []))
+            n_failed = failures.get(name, 0)
+        summary[name] = {'requests': int(len(values)), 'errors': n_failed,
+                         'throughput_per_second': len(values) / elapsed}
+        if len(values):
+            p50, p95, p99 = np.percentile(values, [50, 95, 99]) * 1000
+            summary[name].update(p50_ms=p50, p95_ms=p95, p99_ms=p99, max_ms=values.max() * 1000)
+    return summary
+
+
+def serve(csv_path, port):
+    """Run the inspector on one csv with the Dash server (the server process)"""
+    from inspector.config import config
+    config['inspector']['use_apache'] = False
+    config['inspector']['outdir'] = os.path.dirname(os.path.abspath(csv_path)) + os.sep
+    config['inspector']['csv_name'] = os.path.basename(csv_path)
+    config['inspector']['reload_interval'] = 0
+    config['inspector']['log_level'] = 'WARNING'
+
+    from inspector.archive import load_archive
+    load_archive()
+    from inspector.app import app
+    app.run(port=port)
+
+
+def start_server(csv_path, port, timeout=300):
+    """Start the inspector in a child process and wait until it answers"""
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--serve', csv_path,
+                                '--port', str(port)], stderr=subprocess.DEVNULL, stdout=subprocess.DEVNULL)
+    url = f'http://127.0.0.1:{port}'
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('The inspector server exited before it was ready')
+        try:
+            if http(url + '/_dash-layout', timeout=5)[0] == 200:
+                return process, url
+        except OSError:
+            time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError(f'The inspector server did not answer within {timeout}s')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load test the Archive Inspector on localhost')
+    parser.add_argument('--users', type=int, default=10, help='concurrent simulated users')
+    parser.add_argument('--duration', type=float, default=30, help='seconds to run')
+    parser.add_argument('--think', type=float, default=0.5, help='mean pause between user actions (s)')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the users and synthetic archive')
+    parser.add_argument('--url', help='load test a running server instead of starting one')
+    parser.add_argument('--csv', help='archive csv to serve (default: a synthetic archive)')
+    parser.add_argument('--rows', type=int, default=100000, help='observations in the synthetic archive')
+    parser.add_argument('--port', type=int, default=5599, help='port of the server started for the test')
+    parser.add_argument('--output', help='also write the JSON results to this file')
+    parser.add_argument('--serve', metavar='CSV', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.port)
+        sys.exit()
+
+    process = None
+    with tempfile.TemporaryDirectory() as workdir:
+        url = args.url
+        if url is None:
+            csv_path = args.csv
+            if csv_path is None:
+                from inspector.synthetic import write_synthetic_csv
+                csv_path = write_synthetic_csv(os.path.join(workdir, 'stis_archive.csv'), args.rows, args.seed)
+            print(f'Starting the inspector on {csv_path}...', file=sys.stderr)
+            process, url = start_server(csv_path, args.port)
+        try:
+            print(f'Running {args.users} users against {url} for {args.duration:g}s...', file=sys.stderr)
+            latencies, failures, elapsed = run_load(url.rstrip('/'), args.users, args.duration,
+                                                    args.think, args.seed)
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait()
+
+    summary = summarize(latencies, failures, elapsed)
+    print(f"{'request':<30} {'count':>7} {'errors':>6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name, stats in summary.items():
+        print(f"{name:<30} {stats['requests']:>7} {stats['errors']:>6} {stats['throughput_per_second']:>8.1f} "
+              f"{stats.get('p50_ms', float('nan')):>8.1f} {stats.get('p95_ms', float('nan')):>8.1f} "
+              f"{stats.get('p99_ms', float('nan')):>8.1f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'url': url, 'users': args.users, 'duration': elapsed, 'think': args.think,
+                       'results': summary}, f, indent=2)
@@ -1,8 +1,25 @@
+import argparse
+import logging
 
 from inspector.config import config
-from inspector.fetch_metadata import generate_csv_from_mast
+from inspector.fetch_metadata import generate_csv_from_mast, refresh_csv_from_mast, clear_partitions
+from inspector.profiling import profile_startup
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Launch the STIS Archive Inspector')
+    parser.add_argument('--rebuild-cache', action='store_true',
+                        help='re-parse the archive csv instead of loading the prepared cache')
+    parser.add_argument('--years', type=int, nargs=2, metavar=('START', 'END'),
+                        help='only load the observations of the years START <= year < END')
+    fetch_mode = parser.add_mutually_exclusive_group()
+    fetch_mode.add_argument('--incremental', action='store_true',
+                            help='only fetch observations newer than the existing archive csv')
+    fetch_mode.add_argument('--force', action='store_true',
+                            help='discard fetch checkpoints and refetch every year')
+    args = parser.parse_args()
+    logging.basicConfig(level=config['inspector']['log_level'],
+                        format='%(asctime)s %(levelname)s %(name)s %(message)s')
+
     # Read in Config file
     outdir = config['inspector']['outdir']
     csv_name = config['inspector']['csv_name']
@@ -13,10 +30,24 @@ if __name__ == '__main__':
     stylesheets = config['inspector']['stylesheets']
     mast = config['inspector']['mast']
 
+    if (args.incremental or args.force) and (use_apache or not gen_csv):
+        parser.error('--incremental and --force only apply when fetching from MAST; '
+                     'set use_apache to False and gen_csv to True in inspector/config.py')
 
     if not use_apache and gen_csv:
-        generate_csv_from_mast(csv_name, outdir, datatype, instrument)
+        if args.incremental:
+            refresh_csv_from_mast(csv_name, outdir, datatype, instrument)
+        else:
+            if args.force:
+                clear_partitions(outdir)
+            generate_csv_from_mast(csv_name, outdir, datatype, instrument)
+    print("Loading archive...")
+    with profile_startup():
+        from inspector.archive import load_archive, start_refresher, memory_report, format_memory_report
+        load_archive(rebuild_cache=args.rebuild_cache, year_range=args.years)
+        from inspector.app import app
+    print(format_memory_report(memory_report()))
+    start_refresher()
     print("Launching server...")
-    from inspector.app import app
-    app.run_server(port=5500)
-    #app.run_server(host = '0.0.0.0',port=5050)
+    app.run(port=5500)
+    #app.run(host = '0.0.0.0',port=5050)
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from inspector.archive import prepare_archive
+from inspector.cube import build_cube, detector_totals, select_cube
+from inspector.synthetic import generate_archive
+
+detectors = ["STIS/CCD", "STIS/NUV-MAMA", "STIS/FUV-MAMA"]
+
+
+@pytest.fixture(scope='module')
+def archive():
+    archive, _ = prepare_archive(generate_archive(20000, seed=3), lean=False)
+    return archive
+
+
+def direct_totals(archive, dimension, year_range, detectors=None, obstypes=None):
+    """Count and sum exposure times per label of dimension with plain pandas filters"""
+    selected = archive[(archive['Decimal Year'] >= year_range[0]) & (archive['Decimal Year'] < year_range[1])]
+    if detectors is not None:
+        selected = selected[selected['Instrument Config'].isin(detectors)]
+    if obstypes is not None:
+        selected = selected[selected['obstype'].isin(obstypes)]
+    grouped = selected.groupby(dimension, observed=True)
+    return grouped.size(), grouped['Exp Time'].sum()
+
+
+def nonzero(series):
+    """The non-zero totals of a series as a plain dict"""
+    return {label: value for label, value in series.items() if value != 0}
+
+
+@pytest.mark.parametrize('dimension', ["Filters/Gratings", "Apertures"])
+@pytest.mark.parametrize('year_range, selected_detectors, obstypes', [
+    ([1997, 2021], None, None),
+    ([2000, 2004], detectors[1:], ['Spectroscopic']),
+    ([2012, 2013], ['STIS/CCD'], ['Imaging', 'Coronagraphic']),
+    ([2009, 2012], detectors, ['Spectroscopic', 'Imaging']),
+])
+def test_select_cube_matches_a_direct_filter(archive, dimension, year_range, selected_detectors, obstypes):
+    cube = build_cube(archive, dimension)
+
+    counts, exptimes = select_cube(cube, year_range, detectors=selected_detectors, obstypes=obstypes)
+    expected_counts, expected_exptimes = direct_totals(archive, dimension, year_range,
+                                                       selected_detectors, obstypes)
+    assert expected_counts.sum() > 0
+
+    assert nonzero(counts) == nonzero(expected_counts)
+    assert nonzero(exptimes).keys() == nonzero(expected_exptimes).keys()
+    for label, exptime in nonzero(expected_exptimes).items():
+        assert exptimes[label] == pytest.approx(exptime, rel=1e-12)
+
+
+@pytest.mark.parametrize('year_range', [[1997, 2021], [2001, 2003], [2015, 2016]])
+def test_detector_totals_match_a_direct_filter(archive, year_range):
+    cube = build_cube(archive, "Filters/Gratings")
+
+    counts, exptimes = detector_totals(cube, year_range)
+    expected_counts, expected_exptimes = direct_totals(archive, "Instrument Config", year_range)
+
+    assert nonzero(counts) == nonzero(expected_counts)
+    np.testing.assert_allclose(exptimes[list(expected_exptimes.index)].values, expected_exptimes.values,
+                               rtol=1e-12)
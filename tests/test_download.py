@@ -0,0 +1,101 @@
+import email.message
+import io
+import json
+from urllib import error
+
+import pytest
+
+from inspector.download import download_archive
+
+url = 'https://example.org/stis_archive.csv'
+
+
+class FakeResponse(io.BytesIO):
+    """A urlopen response holding a body and headers"""
+
+    def __init__(self, body, headers):
+        super().__init__(body)
+        self.headers = email.message.Message()
+        for name, value in headers.items():
+            self.headers[name] = value
+
+
+class FakeHost:
+    """Stands in for urlopen, answering with queued responses and recording the requests"""
+
+    def __init__(self, *answers):
+        self.answers = list(answers)
+        self.requests = []
+
+    def __call__(self, req, timeout=None):
+        self.requests.append(req)
+        answer = self.answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+
+def ok(body=b'a,b\n1,2\n', etag='"v1"', last_modified='Mon, 05 Oct 2020 10:00:00 GMT'):
+    return FakeResponse(body, {'ETag': etag, 'Last-Modified': last_modified})
+
+
+def not_modified():
+    return error.HTTPError(url, 304, 'Not Modified', email.message.Message(), None)
+
+
+def test_200_stores_the_file_and_its_validators(tmp_path):
+    path = str(tmp_path / 'archive.csv')
+    host = FakeHost(ok())
+
+    assert download_archive(url, path, max_age=0, urlopen=host) == path
+
+    with open(path, 'rb') as f:
+        assert f.read() == b'a,b\n1,2\n'
+    with open(path + '.meta.json') as f:
+        meta = json.load(f)
+    assert meta['url'] == url
+    assert meta['etag'] == '"v1"'
+    assert meta['last_modified'] == 'Mon, 05 Oct 2020 10:00:00 GMT'
+    assert host.requests[0].get_header('If-none-match') is None
+
+
+def test_304_reuses_the_cached_copy(tmp_path):
+    path = str(tmp_path / 'archive.csv')
+    host = FakeHost(ok(), not_modified())
+    download_archive(url, path, max_age=0, urlopen=host)
+
+    assert download_archive(url, path, max_age=0, urlopen=host) == path
+
+    conditional = host.requests[1]
+    assert conditional.get_header('If-none-match') == '"v1"'
+    assert conditional.get_header('If-modified-since') == 'Mon, 05 Oct 2020 10:00:00 GMT'
+    with open(path, 'rb') as f:
+        assert f.read() == b'a,b\n1,2\n'
+
+
+def test_recent_copy_is_used_without_a_request(tmp_path):
+    path = str(tmp_path / 'archive.csv')
+    host = FakeHost(ok())
+    download_archive(url, path, max_age=3600, urlopen=host)
+
+    assert download_archive(url, path, max_age=3600, urlopen=host) == path
+    assert len(host.requests) == 1
+
+
+def test_unreachable_host_falls_back_to_the_last_good_copy(tmp_path):
+    path = str(tmp_path / 'archive.csv')
+    host = FakeHost(ok(), error.URLError('connection refused'))
+    download_archive(url, path, max_age=0, urlopen=host)
+
+    assert download_archive(url, path, max_age=0, urlopen=host) == path
+    assert len(host.requests) == 2
+    with open(path, 'rb') as f:
+        assert f.read() == b'a,b\n1,2\n'
+
+
+def test_unreachable_host_without_a_copy_raises(tmp_path):
+    path = str(tmp_path / 'archive.csv')
+    host = FakeHost(error.URLError('connection refused'))
+
+    with pytest.raises(error.URLError):
+        download_archive(url, path, max_age=0, urlopen=host)
@@ -0,0 +1,114 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib import error
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from inspector import fetch_metadata
+
+
+def observations(year, n_rows=3):
+    """Raw MAST rows of one year"""
+    return [{'Dataset': f'o{year}{i:04d}', 'Start Time': f'{year}-03-0{i + 1} 10:00:00',
+             'Exp Time': 100.0 + i, 'Instrument Config': 'STIS/CCD', 'Operating Mode': 'ACCUM',
+             'Apertures': '52X2', 'Filters/Gratings': 'G430L', 'Central Wavelength': 4300.0}
+            for i in range(n_rows)]
+
+
+@pytest.fixture
+def mast():
+    """A local stand-in for the MAST search endpoint.
+
+    answers maps a year to the list of HTTP statuses to reply with, one per
+    request; once used up (or for other years) the year's rows are returned,
+    or [] for the years in empty.
+    """
+    answers = {}
+    empty = set()
+    requests = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            query = parse_qs(urlparse(self.path).query)
+            year = int(query['sci_start_time'][0].split(' .. ')[0].split()[-1])
+            requests.append(year)
+            statuses = answers.get(year, [])
+            status = statuses.pop(0) if statuses else 200
+            rows = [] if year in empty else observations(year)
+            body = json.dumps(rows).encode() if status == 200 else b'error'
+            self.send_response(status)
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield {'url': 'http://127.0.0.1:{}/search.php'.format(server.server_port),
+           'answers': answers, 'empty': empty, 'requests': requests}
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Record the backoff delays instead of sleeping"""
+    delays = []
+    monkeypatch.setattr(fetch_metadata.time, 'sleep', delays.append)
+    return delays
+
+
+def test_server_errors_are_retried_with_backoff(mast, sleeps):
+    mast['answers'][2001] = [503, 500]
+
+    results = fetch_metadata.fetch_years([2000, 2001], 'STIS', 'S', max_workers=2, url=mast['url'],
+                                         retries=3, backoff=0.5, timeout=5)
+
+    assert [len(result) for result in results] == [3, 3]
+    assert mast['requests'].count(2001) == 3
+    assert sleeps == [0.5, 1.0]
+
+
+def test_client_errors_are_not_retried(mast, sleeps):
+    mast['answers'][2001] = [404]
+
+    with pytest.raises(error.HTTPError):
+        fetch_metadata.fetch_year(2001, 'STIS', 'S', url=mast['url'], retries=3, backoff=0.5, timeout=5)
+
+    assert mast['requests'] == [2001]
+    assert sleeps == []
+
+
+def test_failed_years_are_reported_after_the_others_finish(mast, sleeps):
+    mast['answers'][2001] = [503] * 3
+    finished, failed = [], []
+
+    with pytest.raises(RuntimeError, match='2001'):
+        fetch_metadata.fetch_years([2000, 2001, 2002], 'STIS', 'S', max_workers=2, url=mast['url'],
+                                   retries=2, backoff=0.1, timeout=5,
+                                   handle_year=lambda year, result: finished.append(year),
+                                   handle_error=lambda year, e: failed.append((year, e.code)))
+
+    assert sorted(finished) == [2000, 2002]
+    assert failed == [(2001, 503)]
+    assert mast['requests'].count(2001) == 3
+    assert sleeps == [0.1, 0.2]
+
+
+def test_unreachable_host_is_retried_then_raised(sleeps):
+    with pytest.raises(error.URLError):
+        fetch_metadata.fetch_year(2001, 'STIS', 'S', url='http://127.0.0.1:9/search.php',
+                                  retries=2, backoff=0.1, timeout=5)
+
+    assert sleeps == [0.1, 0.2]
+
+
+def test_empty_year_is_none(mast):
+    mast['empty'].add(2005)
+
+    assert fetch_metadata.fetch_year(2005, 'STIS', 'S', url=mast['url'], timeout=5) is None
+    assert len(fetch_metadata.fetch_year(2004, 'STIS', 'S', url=mast['url'], timeout=5)) == 3
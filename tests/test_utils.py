@@ -0,0 +1,62 @@
+import random
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from inspector.utils import dec_year, dt_to_dec, timeline
+
+
+def original_dt_to_dec(dt):
+    """The per-datetime decimal year calculation dec_year replaced"""
+    year_start = datetime(dt.year, 1, 1)
+    year_end = year_start.replace(year=dt.year + 1)
+    return dt.year + ((dt - year_start).total_seconds() /  # seconds so far
+                      float((year_end - year_start).total_seconds()))  # seconds in year
+
+
+boundary_datetimes = [
+    datetime(2000, 2, 29),
+    datetime(2000, 2, 29, 12, 30, 15),
+    datetime(2000, 12, 31, 23, 59, 59),
+    datetime(2004, 3, 1),
+    datetime(2003, 12, 31, 23, 59, 59, 999999),
+    datetime(1900, 3, 1),
+    datetime(1900, 12, 31, 23, 59, 59),
+    datetime(2100, 3, 1, 6),
+    datetime(1997, 1, 1),
+]
+
+
+def random_datetimes(n, seed=0):
+    rng = random.Random(seed)
+    start = datetime(1900, 1, 1)
+    span = int((datetime(2101, 1, 1) - start).total_seconds() * 1e6)
+    return [start + timedelta(microseconds=rng.randrange(span)) for _ in range(n)]
+
+
+def test_dec_year_matches_original_exactly():
+    datetimes = boundary_datetimes + random_datetimes(20000)
+    expected = np.array([original_dt_to_dec(dt) for dt in datetimes])
+    assert (dec_year(datetimes) == expected).all()
+
+
+def test_dt_to_dec_matches_original_exactly():
+    for dt in boundary_datetimes + random_datetimes(1000, seed=1):
+        assert dt_to_dec(dt) == original_dt_to_dec(dt), dt
+
+
+def test_timeline_counts_edge_observations_once():
+    bins = np.array([2000, 2001, 2002, 2003])
+    # On the first edge, inner edges, inside a bin, on the last edge and outside the bins
+    years = [2000.0, 2001.0, 2001.0, 2001.5, 2002.0, 2003.0, 1999.9, 2003.1]
+
+    assert timeline(years, bins).tolist() == [1, 3, 1]
+    assert timeline(years, bins).sum() == 5
+
+
+def test_timeline_sums_weights_per_bin():
+    bins = np.array([2000, 2001, 2002, 2003])
+    years = [2000.0, 2001.0, 2001.5, 2002.0, 2003.0]
+    exptimes = [10.0, 20.0, np.nan, 40.0, 50.0]
+
+    assert timeline(years, bins, weights=exptimes).tolist() == [10.0, 20.0, 40.0]
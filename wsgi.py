@@ -0,0 +1,76 @@
+"""WSGI entry point for serving the STIS Archive Inspector with several workers.
+
+Serve with a pre-fork server such as gunicorn:
+
+    gunicorn --workers 4 --bind 0.0.0.0:5500 wsgi:server
+
+Every worker maps the same prepared-archive cache files read-only, so the
+archive columns are held once in the OS page cache however many workers run.
+Do not use --preload: the archive refresher thread would not survive the fork.
+
+Run `python wsgi.py` for a local smoke test of the WSGI app.
+"""
+import json
+import logging
+import time
+
+import numpy as np
+import pandas as pd
+
+from inspector.config import config
+from inspector.archive import get_dataset, load_archive, start_refresher, memory_report, format_memory_report
+from inspector.profiling import profile_startup
+from inspector.utils import metric_names
+
+logging.basicConfig(level=config['inspector']['log_level'],
+                    format='%(asctime)s %(levelname)s %(name)s %(message)s')
+config['inspector']['serve_mmap'] = True
+with profile_startup():
+    load_archive(mmap=True)
+    from inspector.app import app
+start_refresher()
+
+server = app.server
+
+
+def smoke_test():
+    """Request the page, the layout and one callback through the WSGI app"""
+    client = server.test_client()
+    dataset = get_dataset()
+    years = [int(dataset['years'][0]), int(dataset['years'][-1]) + 1]
+    update = {'output': 'detector-pie-store.data',
+              'outputs': {'id': 'detector-pie-store', 'property': 'data'},
+              'inputs': [{'id': 'detector-date-slider', 'property': 'value', 'value': years}],
+              'changedPropIds': ['detector-date-slider.value']}
+
+    for method, path, body in [('get', '/', None),
+                               ('get', '/_dash-layout', None),
+                               ('post', '/_dash-update-component', update)]:
+        start = time.time()
+        if body is None:
+            response = getattr(client, method)(path)
+        else:
+            response = client.post(path, data=json.dumps(body), content_type='application/json')
+        print(f'{method.upper()} {path}: {response.status_code} '
+              f'({len(response.data)} bytes, {1000*(time.time() - start):.1f} ms)')
+        assert response.status_code == 200, response.data[:500]
+
+    # The pie chart store holds the figures of both metrics; the browser picks one
+    result = json.loads(response.data)['response']
+    figures = result['detector-pie-store']['data'] if 'detector-pie-store' in result else result['props']['data']
+    assert sorted(figures) == sorted(metric_names), sorted(figures)
+
+    if dataset['mmap']:
+        # Check that the workers really share the cache files instead of holding copies
+        archive = dataset['archive']
+        for column in archive.columns:
+            if pd.api.types.is_numeric_dtype(archive[column]):
+                assert isinstance(archive[column].values, np.memmap), f'{column} is not memory-mapped'
+
+    print(f"Archive version {dataset['version']}: {len(dataset['archive'])} observations, "
+          f"memory-mapped: {dataset['mmap']}")
+    print(format_memory_report(memory_report(dataset)))
+
+
+if __name__ == '__main__':
+    smoke_test()